@@ -23,6 +23,7 @@ class Recipe:
                 dish : str representing the name of the dish
         """
         self.dish : str = dish
+        self.row : int = None # Row of the dataset the recipe was built from, if any
         self.list : list[tuple[str, float, str]] = []
         self.nutritional_values : dict[str, float] = {
             'Calories': 0.0,
@@ -40,6 +41,14 @@ class Recipe:
             'VitaminE': 0.0,
             'VitaminD': 0.0
         }
+        # Filled in once by the nutrition pass and reused by every later phase
+        self.matches : list[tuple[str, float, int]] = [] # USDA (description, score, row) of each ingredient in self.list
+        self.grams : dict[str, int] = {} # Weight of each matched ingredient, in grams
+        self.ingredient_nutrition : dict[str, list[int]] = {} # Scaled nutritional values of each matched ingredient
+        self.percentages : dict[str, int] = {} # total_<metric>_pct of the daily caloric intake (carb, protein, fat, satfat, sugar)
+        self.resolved : bool = False # Whether the nutritional values above have been computed
+        self.allergens : int = None # Allergen mask of the ingredients (see allergen_index), when known
+        self.substitutions : list[tuple[str, str]] = [] # (original, substitute) ingredients, when refactored
 
     def add(self, ingredient: str, quantity: float, metric: str) -> None:
         """ Add an ingredient to the recipe. 
@@ -51,6 +60,7 @@ class Recipe:
                 None
         """
         self.list.append([ingredient, quantity, metric])
+        self.allergens = None # No longer describes the ingredients
         
     
     def incorporate(self, nutrition_metric: str, nutrition_value: float) -> None:
@@ -64,19 +74,52 @@ class Recipe:
         # for metric in nutrition_metrics:
         self.nutritional_values[nutrition_metric] += nutrition_value
 
-    def __str__(self) -> None:
+    def reset_nutrition(self) -> None:
+        """ Forget the compiled nutrition, e.g. after the ingredients changed; the next nutrition pass recomputes it. """
+        for metric in self.nutritional_values: self.nutritional_values[metric] = 0.0
+        self.grams, self.ingredient_nutrition, self.percentages = {}, {}, {}
+        self.resolved = False
+
+    def to_dict(self) -> dict:
+        """ JSON serializable representation of the Recipe: ingredients, nutritional values and percentages, and the
+            nutritional values of each matched ingredient (USDA description, grams and the nutritional_values keys). """
+        metrics = list(self.nutritional_values)
+        order = {match[0]: i for i, match in reversed(list(enumerate(self.matches))) if match is not None} # Ingredient order
+        breakdown = sorted(self.ingredient_nutrition.items(), key=lambda item: order.get(item[0], len(order)))
+        return {
+            "dish": self.dish,
+            "ingredients": [{"ingredient": item[0], "quantity": item[1], "metric": item[2]} for item in self.list],
+            "nutritional_values": dict(self.nutritional_values),
+            "percentages": dict(self.percentages),
+            "ingredient_nutrition": [{"ingredient": description, "grams": self.grams.get(description), **dict(zip(metrics, values))}
+                                     for description, values in breakdown],
+            "substitutions": [{"original": original, "substitute": substitute} for original, substitute in self.substitutions],
+        }
+
+    @staticmethod
+    def render(recipe: dict) -> str:
+        """ Text of a Recipe from its to_dict representation; see __str__. """
+        rule = "-----------------------------"
+        lines = [f"{recipe['dish']} Ingredients:", rule]
+        lines += [f"{item['ingredient']} {item['quantity']} {item['metric']}" for item in recipe["ingredients"]]
+        lines += ["", "Nutritional Values:", rule]
+        lines += [f"{key}: {value}" for key, value in recipe["nutritional_values"].items()]
+        if len(recipe.get("ingredient_nutrition", [])):
+            lines += ["", "Nutritional Values per Ingredient:", rule]
+            for values in recipe["ingredient_nutrition"]:
+                nutrients = ", ".join(f"{key}: {value}" for key, value in values.items() if key not in ("ingredient", "grams"))
+                lines.append(f"{values['ingredient']} ({values['grams']} g): {nutrients}")
+        if len(recipe.get("substitutions", [])):
+            lines += ["", "Substitutions:", rule]
+            lines += [f"{item['original']} -> {item['substitute']}" for item in recipe["substitutions"]]
+        return "\n".join(lines) + "\n\n"
+
+    def __str__(self) -> str:
         """ String representation of the Recipe: 
                 [ingredient] [quantity] [metric]
+            followed by its nutritional values, per ingredient when compiled, and its substitutions.
         """
-        rep = f"{self.dish} Ingredients:\n-----------------------------\n"
-        for item in self.list:
-            rep += f"{item[0]} {item[1]} {item[2]}\n"
-
-        rep += "\nNutritional Values:\n-----------------------------\n"
-        for key, value in self.nutritional_values.items():
-            rep += f"{key}: {value}\n"
-        rep += "\n"
-        return rep
+        return Recipe.render(self.to_dict())
 
 class Dish:
     def __init__(self):
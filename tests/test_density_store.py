@@ -0,0 +1,46 @@
+import pytest
+from utilities.density_store import DensityStore, read_density_facts
+
+@pytest.fixture
+def store(tmp_path):
+    trusted = tmp_path / "densities_asp.lp"
+    trusted.write_text('density("Cheese,cheddar", 1100).\n'
+                       'density("Cheese,swiss", 1100).\n'
+                       'density("Cheese,feta", 900).\n'
+                       'density("Flour", 590).\n'
+                       'density("Beef,ground,80% lean,1/8\\" fat", 950).\n', encoding='utf-8')
+    other = tmp_path / "densities.txt"
+    other.write_text('density("cheese,cheddar", 0.5).\n'
+                     'density("Milk", 1.03).\n'
+                     'density("broken" 1).\n'
+                     '% density("commented", 1).\n', encoding='utf-8')
+    return DensityStore([(str(trusted), 1), (str(other), 1000), (str(tmp_path / "missing.txt"), 1)])
+
+def test_first_file_wins_and_files_are_scaled(store):
+    assert store.density("cheese,cheddar") == 1100
+    assert store.density("MILK") == 1030
+    assert len(store) == 6
+
+def test_missing_files_are_skipped(store, tmp_path):
+    assert store.sources == [str(tmp_path / "densities_asp.lp"), str(tmp_path / "densities.txt")]
+
+def test_prefix_fallback(store):
+    assert store.density("cheese,cheddar,sharp,sliced") == 1100
+
+def test_category_fallback(store):
+    assert store.density("cheese,gouda") == 1100 # Most common density of the cheese category
+
+def test_head_word_fallback(store):
+    assert store.density("wheat flour") == 590
+
+def test_unknown_description(store):
+    assert store.density("kohlrabi,raw") is None
+
+def test_quotes_in_descriptions(store):
+    assert store.density('beef,ground,80% lean,1/8" fat') == 950
+
+def test_unparsable_facts_are_reported(tmp_path, capsys):
+    path = tmp_path / "densities.txt"
+    path.write_text('density("Milk", 1.03).\ndensity("broken" 1).\n', encoding='utf-8')
+    assert read_density_facts(str(path), 1000) == [("Milk", 1030)]
+    assert "Skipped 1 unparsable density facts" in capsys.readouterr().out
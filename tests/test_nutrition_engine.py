@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from models.classes import Recipe
+from utilities.asp import default_factory
+from utilities.nutrition import read_model
+from utilities.nutrition_engine import NutritionEngine, NUTRIENTS
+
+# USDA descriptions and their 14 nutritional values per 100 g, scaled by 1000 as the matchers return them
+values = {
+    "milk,whole": [61000, 3150, 3250, 4800, 43000, 1860, 10000, 5050, 113000, 30, 132000, 0, 70, 1300],
+    "flour,wheat": [364000, 10330, 980, 76310, 2000, 155, 0, 270, 15000, 4640, 107000, 0, 60, 0],
+    "beef,ground": [254000, 17170, 20000, 0, 66000, 7580, 71000, 0, 18000, 1940, 270000, 0, 180, 100],
+    "salt,table": [0, 0, 0, 0, 38758000, 0, 0, 0, 24000, 330, 8000, 0, 0, 0],
+}
+
+recipes = {
+    "volumes and masses": [("milk,whole", 2, "cup", 1030), ("flour,wheat", 250, "gram", 590), ("beef,ground", 1, "pound", None)],
+    "volume without a density": [("milk,whole", 2, "cup", None), ("beef,ground", 8, "ounce", None)],
+    "ingredient without a quantity": [("salt,table", None, None, None), ("flour,wheat", 3, "cup", 590)],
+    "duplicate lines": [("flour,wheat", 100, "gram", 590), ("flour,wheat", 100, "gram", 590), ("flour,wheat", 50, "gram", 590)],
+    "no calories": [("salt,table", 5, "gram", None)],
+}
+
+def arguments(lines):
+    names = [name for name, _, _, _ in lines]
+    return names, [values[name] for name in names], [q for _, q, _, _ in lines], [m for _, _, m, _ in lines], [d for _, _, _, d in lines]
+
+def clingo_recipe(lines) -> Recipe:
+    recipe = Recipe("clingo")
+    resolver = default_factory().resolver()
+    resolver.add_ingredients(*arguments(lines))
+    resolver.ground()
+    _, flag = resolver.resolve()
+    assert flag
+    read_model(recipe, resolver.models)
+    return recipe
+
+def numpy_recipe(lines) -> Recipe:
+    recipe = Recipe("numpy")
+    read_model(recipe, NutritionEngine().compute(*arguments(lines)).models)
+    return recipe
+
+@pytest.mark.parametrize("name", list(recipes))
+def test_engine_agrees_with_clingo(name):
+    expected, actual = clingo_recipe(recipes[name]), numpy_recipe(recipes[name])
+    assert actual.nutritional_values == expected.nutritional_values
+    assert actual.percentages == expected.percentages
+    assert actual.grams == expected.grams
+    assert actual.ingredient_nutrition == expected.ingredient_nutrition
+
+@pytest.mark.parametrize("name", list(recipes))
+def test_cross_check_finds_no_mismatch(name):
+    assert NutritionEngine().cross_check(*arguments(recipes[name])) == []
+
+def test_every_nutrient_is_summed():
+    recipe = clingo_recipe(recipes["volumes and masses"])
+    for column, metric in enumerate(NUTRIENTS):
+        assert recipe.nutritional_values[metric] == sum(values[column] for values in recipe.ingredient_nutrition.values())
+    assert recipe.nutritional_values["Calcium"] > 0 and recipe.nutritional_values["VitaminD"] > 0
+
+def test_batch_matches_single_recipes():
+    names = list(recipes)
+    recipe_ids, flat = [], [[], [], [], [], []]
+    for i, name in enumerate(names):
+        columns = arguments(recipes[name])
+        recipe_ids += [i] * len(columns[0])
+        for column, items in zip(flat, columns): column += items
+    engine = NutritionEngine()
+    batch = engine.compute_batch(recipe_ids, *flat, recipes=len(names))
+    for i, name in enumerate(names):
+        single = engine.compute(*arguments(recipes[name]))
+        assert np.array_equal(batch["totals"][i], single.totals)
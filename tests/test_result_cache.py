@@ -0,0 +1,63 @@
+import pytest
+from utilities import result_cache
+from utilities.result_cache import ResultCache
+
+source = {"dataset": "abc", "usda": "def"}
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Controlled time.time() of the cache module; advance with clock[0] += seconds. """
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = ResultCache(str(tmp_path / "results.sqlite"), source, ttl=60, max_entries=2)
+    yield cache
+    cache.close()
+
+def test_put_and_get(cache):
+    key = cache.key([3, 1], {"Diabetes": ["Type 2"]})
+    assert cache.get(key) is None
+    cache.put(key, {"status": "safe"})
+    assert cache.get(key) == {"status": "safe"}
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+
+def test_keys_of_equivalent_queries(cache):
+    assert cache.key([1], {"Allergen": "Eggs", "Obesity": []}) == cache.key([1], {"Obesity": [], "Allergen": ["Eggs"]})
+    assert cache.key([1], {"Allergen": ["Eggs", "Milk"]}) == cache.key([1], {"Allergen": ["Milk", "Eggs"]})
+
+def test_keys_of_different_queries(cache, tmp_path):
+    key = cache.key([1], {"Obesity": []})
+    assert key != cache.key([2], {"Obesity": []})
+    assert key != cache.key([1], {"Hypertension": []})
+    assert key != cache.key([1], {"Obesity": []}, substitute=True)
+    assert key != ResultCache(str(tmp_path / "other.sqlite"), {**source, "usda": "ghi"}).key([1], {"Obesity": []})
+
+def test_entries_expire(cache, clock):
+    key = cache.key([1], {})
+    cache.put(key, {"status": "safe"})
+    clock[0] += 59
+    assert cache.get(key) is not None
+    clock[0] += 2 # 61 seconds after the put
+    assert cache.get(key) is None
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    keys = [cache.key([row], {}) for row in range(3)]
+    cache.put(keys[0], {"row": 0})
+    clock[0] += 1
+    cache.put(keys[1], {"row": 1})
+    clock[0] += 1
+    assert cache.get(keys[0]) == {"row": 0} # Now more recent than keys[1]
+    clock[0] += 1
+    cache.put(keys[2], {"row": 2})
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == {"row": 0}
+    assert cache.get(keys[2]) == {"row": 2}
+
+def test_clear(cache):
+    cache.put(cache.key([1], {}), {})
+    cache.clear()
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,61 @@
+import pytest
+from utilities.units import UnitRegistry, default_registry
+
+unit_data = {
+    "units": {
+        "gram": {"kind": "mass", "factor": 1000, "aliases": ["g", "grams"]},
+        "ounce": {"kind": "mass", "factor": 28350, "aliases": ["oz", "oz."]},
+        "milliliter": {"kind": "volume", "factor": 1000, "aliases": ["ml"]},
+        "cup": {"kind": "volume", "factor": 236588, "aliases": ["c", "c."]},
+    },
+    "pieces": {
+        "piece": {"aliases": [""], "weights": {"egg": 50, "egg yolk": 17}},
+        "can": {"aliases": ["can", "cans"], "weights": {"*": 425, "tomato paste": 170}},
+    },
+}
+
+@pytest.fixture
+def registry():
+    return UnitRegistry(unit_data)
+
+def test_canonical_aliases(registry):
+    assert registry.canonical("oz.") == "ounce"
+    assert registry.canonical(" C. ") == "cup"
+    assert registry.canonical("") == "piece"
+    assert registry.canonical("handful") is None
+
+def test_resolve_whole_quantities_keep_their_unit(registry):
+    assert registry.resolve("flour", 2.0, "c.") == (2, "cup")
+    assert registry.resolve("beef", 8, "oz") == (8, "ounce")
+
+def test_resolve_fractions_go_to_the_base_unit(registry):
+    assert registry.resolve("milk", 0.5, "c.") == (118, "milliliter")
+    assert registry.resolve("cheese", 1.5, "oz.") == (42, "gram")
+
+def test_resolve_pieces_are_weighed(registry):
+    assert registry.resolve("eggs", 2.0, "") == (100, "gram")
+    assert registry.resolve("large egg yolks", 3.0, "") == (51, "gram") # Longest keyword wins
+    assert registry.resolve("tomato paste", 1.0, "can") == (170, "gram")
+    assert registry.resolve("kidney beans", 2.0, "cans") == (850, "gram") # "*" weight
+
+def test_resolve_unknown_lines(registry):
+    assert registry.resolve("salt", None, "tsp.") == (None, None)
+    assert registry.resolve("salt", 1.0, "pinch") == (None, None)
+    assert registry.resolve("parsley", 1.0, "") == (None, None) # No piece weight
+
+def test_grams(registry):
+    assert registry.grams(8, "ounce") == 226
+    assert registry.grams(2, "cup", 1030) == 487
+    assert registry.grams(2, "cup") is None # Volume without a density
+    assert registry.grams(None, "gram") is None
+
+def test_duplicate_alias_is_rejected():
+    data = {"units": {"gram": {"kind": "mass", "factor": 1000, "aliases": ["g"]},
+                      "gallon": {"kind": "volume", "factor": 3785410, "aliases": ["g"]}}, "pieces": {}}
+    with pytest.raises(ValueError):
+        UnitRegistry(data)
+
+def test_default_registry_program():
+    program = default_registry().program
+    assert "unit(gram, mass, 1000)." in program
+    assert "unit(cup, volume, 236588)." in program
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import pytest
+from models.classes import Recipe
+from utilities import writers
+from utilities.writers import ResultWriter, JSONLWriter, TextWriter, SQLiteWriter, ParquetWriter, flatten, open_writer
+
+def result(id: int, status: str = "safe") -> dict:
+    recipe = Recipe("Pancakes")
+    recipe.add("milk", 1.0, "c.")
+    recipe.add("flour", 2.0, "c.")
+    recipe.nutritional_values["Calories"] = 1200
+    recipe.percentages = {"carb": 40, "protein": 8, "fat": 5, "satfat": 2, "sugar": 4}
+    recipe.grams = {"milk,whole": 243, "flour,wheat": 250}
+    recipe.ingredient_nutrition = {"milk,whole": [148] + [1] * 13, "flour,wheat": [910] + [2] * 13}
+    recipe.matches = [("milk,whole", 100.0, 0), ("flour,wheat", 100.0, 1)]
+    return {"id": id, "query": "pancakes", "status": status, "dish": "Pancakes", "variants": 3,
+            "specified_constraints": {"Obesity": []}, "recipe": recipe.to_dict()}
+
+error = {"id": "e", "query": "nothing", "status": "error", "error": "No recipe found", "specified_constraints": {}}
+
+def test_result_writer_is_abstract():
+    with pytest.raises(TypeError):
+        ResultWriter("results.jsonl")
+
+def test_flatten():
+    row = flatten(result(1))
+    assert row["Calories"] == 1200 and row["fat_pct"] == 5
+    assert json.loads(row["ingredient_nutrition"])[0]["ingredient"] == "milk,whole"
+    assert flatten(error)["Calories"] is None and flatten(error)["error"] == "No recipe found"
+
+def test_results_are_buffered(tmp_path):
+    path = tmp_path / "results.jsonl"
+    writer = JSONLWriter(str(path), buffer_size=2)
+    writer.write(result(1))
+    assert (len(writer.buffer), writer.written) == (1, 0)
+    writer.write(result(2))
+    assert (len(writer.buffer), writer.written) == (0, 2)
+    writer.write(error)
+    writer.close()
+    assert [json.loads(line)["id"] for line in path.read_text().splitlines()] == [1, 2, "e"]
+    assert writer.written == 3
+
+def test_jsonl_append(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with JSONLWriter(path) as writer: writer.write(result(1))
+    with JSONLWriter(path, append=True) as writer: writer.write(result(2))
+    with open(path) as file:
+        assert len(file.readlines()) == 2
+
+def test_text(tmp_path):
+    path = tmp_path / "results.txt"
+    with TextWriter(str(path)) as writer:
+        writer.write(result(1, "failed") | {"violations": ["Obesity"]})
+        writer.write(error)
+    text = path.read_text()
+    assert "Query: pancakes" in text and "Violations: Obesity" in text
+    assert "milk,whole (243 g)" in text
+    assert "Error: No recipe found" in text
+
+def test_sqlite(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    with SQLiteWriter(path, buffer_size=1) as writer:
+        writer.write(result(1))
+        writer.write(error)
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT status, Calories FROM results ORDER BY rowid").fetchall() == [("safe", 1200), ("error", None)]
+    assert db.execute("SELECT result, ingredient, grams, Calories FROM ingredient_nutrition").fetchall() == \
+           [(1, "milk,whole", 243, 148), (1, "flour,wheat", 250, 910)]
+    db.close()
+    with SQLiteWriter(path) as writer: writer.write(result(2)) # Replaces the file
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM results").fetchone() == (1,)
+    db.close()
+
+def test_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "results.parquet")
+    with ParquetWriter(path) as writer:
+        writer.write(result(1))
+        writer.write(error)
+    table = pq.read_table(path)
+    assert table.column("id").to_pylist() == ["1", "e"]
+    assert table.column("Calories").to_pylist() == [1200.0, None]
+
+def test_parquet_needs_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(writers, "pa", None)
+    with pytest.raises(ImportError):
+        ParquetWriter(str(tmp_path / "results.parquet"))
+
+def test_open_writer(tmp_path):
+    for name, kind in [("a.jsonl", JSONLWriter), ("a.txt", TextWriter), ("a.db", SQLiteWriter), ("a.out", JSONLWriter)]:
+        with open_writer(str(tmp_path / name)) as writer: assert type(writer) is kind
+    with open_writer(str(tmp_path / "a.out"), format="text") as writer: assert type(writer) is TextWriter
+    with pytest.raises(ValueError):
+        open_writer(str(tmp_path / "a.out"), format="xml")
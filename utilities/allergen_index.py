@@ -0,0 +1,168 @@
+import os
+import ast # To convert string of a list from the Kaggle dataset to a list
+import json
+import pickle
+import hashlib
+import numpy as np
+from utilities.dataset_cache import RecipeDataset
+from utilities.ingredient_store import IngredientStore
+from utilities.nutrient_index import NutrientIndex
+from utilities.text import words # Normalized words shared with the unit registry
+
+INDEX_VERSION = 1
+INDEX_FILE = "allergen_index.pkl"
+allergens_filepath = os.path.join(os.path.dirname(__file__), "..", "config", "allergens.json")
+
+# USDA qualifiers that name a preparation or a variety rather than a food; never taken as allergen terms
+QUALIFIERS = {"raw", "cooked", "whole", "white", "dry", "dried", "fresh", "frozen", "canned", "plain", "regular", "fluid",
+              "lowfat", "nonfat", "reduced fat", "with salt", "without salt", "salted", "unsalted", "prepared", "commercial",
+              "enriched", "unenriched", "toasted", "roasted", "mixed", "imitation", "other", "all types"}
+
+def read_taxonomy(path: str = allergens_filepath) -> list[dict]:
+    """ Allergens of config/allergens.json: name, terms, exclude (phrases that do not count) and USDA prefixes. """
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)["allergens"]
+
+def read_ner_vocabulary(dataset: RecipeDataset) -> set[str]:
+    """ Distinct ingredient names of the NER column, normalized as taxonomy terms. """
+    vocabulary = set()
+    column = dataset.columns['NER']
+    for row in range(len(dataset)):
+        try:
+            names = json.loads(column[row])
+        except ValueError:
+            names = ast.literal_eval(column[row])
+        vocabulary.update(" ".join(words(name)) for name in names)
+    return vocabulary
+
+def expand_taxonomy(taxonomy: list[dict], descriptions: list[str], ner_vocabulary: set[str]) -> list[dict]:
+    """ Add the varieties USDA lists under each allergen's prefixes to its terms ("cheese,gruyere" adds "gruyere" to Milk),
+        as long as recipes use them as an ingredient of their own (an entry of the NER vocabulary).
+        @args:
+            taxonomy : list of allergens, as read by read_taxonomy
+            descriptions : list of lower case USDA descriptions ("cheese,gruyere")
+            ner_vocabulary : set of normalized NER ingredient names
+        @return:
+            list - A copy of the taxonomy with the extra terms.
+    """
+    expanded = []
+    for allergen in taxonomy:
+        terms = list(allergen["terms"])
+        known = {" ".join(words(term)) for term in terms}
+        for prefix in allergen.get("usda", []):
+            prefix = prefix.split(",")
+            for description in descriptions:
+                tokens = [token.strip() for token in description.split(",")]
+                if tokens[:len(prefix)] != prefix or len(tokens) <= len(prefix): continue
+                variety = tokens[len(prefix)]
+                key = " ".join(words(variety))
+                if variety in QUALIFIERS or key in known or key not in ner_vocabulary: continue
+                known.add(key)
+                terms.append(variety)
+        expanded.append({**allergen, "terms": terms})
+    return expanded
+
+class AllergenMatcher:
+    def __init__(self, taxonomy: list[dict]):
+        """ Compiled allergen taxonomy: every term and exclusion phrase hashed by its normalized words, so that an
+            ingredient is tagged with one dictionary lookup per word n-gram instead of a scan over all terms.
+            Allergen i is bit i of a mask.
+            @args:
+                taxonomy : list of allergens, as read by read_taxonomy (optionally expanded)
+        """
+        self.names : list[str] = [allergen["name"] for allergen in taxonomy]
+        self.terms : dict[tuple, int] = {}
+        self.exclusions : dict[tuple, int] = {}
+        for bit, allergen in enumerate(taxonomy):
+            for term in [allergen["name"], *allergen["terms"]]:
+                key = tuple(words(term))
+                if key: self.terms[key] = self.terms.get(key, 0) | 1 << bit
+            for phrase in allergen.get("exclude", []):
+                key = tuple(words(phrase))
+                if key: self.exclusions[key] = self.exclusions.get(key, 0) | 1 << bit
+        self.longest = max(map(len, list(self.terms) + list(self.exclusions)), default=1)
+
+    def bits(self, allergens: list[str]) -> int:
+        """ Mask of the named allergens (case insensitive); names outside the taxonomy are ignored. """
+        positions = {name.lower(): bit for bit, name in enumerate(self.names)}
+        mask = 0
+        for allergen in allergens:
+            if allergen.lower() in positions: mask |= 1 << positions[allergen.lower()]
+        return mask
+
+    def mask(self, ingredient: str) -> int:
+        """ Allergens of one ingredient. A term found inside an exclusion phrase ("butter" in "peanut butter") does not
+            count for the allergens the phrase excludes. """
+        tokens = words(ingredient)
+        found, excluded = [], []
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(start + self.longest, len(tokens)) + 1):
+                key = tuple(tokens[start:end])
+                if key in self.terms: found.append((start, end, self.terms[key]))
+                if key in self.exclusions: excluded.append((start, end, self.exclusions[key]))
+        mask = 0
+        for start, end, bits in found:
+            for skip_start, skip_end, skip_bits in excluded:
+                if skip_start <= start and end <= skip_end: bits &= ~skip_bits
+            mask |= bits
+        return mask
+
+    def recipe_mask(self, ingredients: list[str]) -> int:
+        mask = 0
+        for ingredient in ingredients:
+            mask |= self.mask(ingredient)
+        return mask
+
+_default_matcher : AllergenMatcher = None
+
+def default_matcher() -> AllergenMatcher:
+    """ Matcher of the unexpanded taxonomy, for recipes built outside an ingredient store. """
+    global _default_matcher
+    if _default_matcher is None: _default_matcher = AllergenMatcher(read_taxonomy())
+    return _default_matcher
+
+class AllergenIndex:
+    def __init__(self, matcher: AllergenMatcher, store: IngredientStore, source: dict = None):
+        """ Allergen masks of the whole dataset, computed once at ingest time:
+            - ingredient_masks: mask of each ingredient of the store's vocabulary
+            - recipe_masks: mask of each recipe row, the OR of its ingredients' masks
+            A recipe is then checked for allergens with a single bitwise AND.
+            @args:
+                matcher : AllergenMatcher tagging the ingredients
+                store : IngredientStore whose vocabulary and recipe rows are tagged
+                source : dict signature of the dataset, taxonomy and USDA data; used to detect a stale index
+        """
+        self.source = source
+        self.matcher = matcher
+        self.ingredient_masks = np.fromiter((matcher.mask(name) for name in store.vocabulary.tolist()),
+                                            dtype=np.uint32, count=len(store.vocabulary))
+        line_masks = np.append(self.ingredient_masks[np.asarray(store.ingredient)], np.uint32(0))
+        starts = np.asarray(store.offsets[:-1])
+        self.recipe_masks = np.bitwise_or.reduceat(line_masks, starts) if len(starts) else np.zeros(0, dtype=np.uint32)
+        self.recipe_masks[np.diff(np.asarray(store.offsets)) == 0] = 0 # reduceat yields the next line for empty rows
+
+    @classmethod
+    def open(cls, dataset: RecipeDataset, store: IngredientStore, nutrient_index: NutrientIndex, taxonomy_path: str = allergens_filepath) -> 'AllergenIndex':
+        """ Load the index saved next to dataset, building and saving it first if it is missing or stale. """
+        path = os.path.join(dataset.cache_dir, INDEX_FILE)
+        with open(taxonomy_path, 'rb') as file:
+            taxonomy_hash = hashlib.sha1(file.read()).hexdigest()
+        source = {"version": INDEX_VERSION, **dataset.meta["source"], "taxonomy": taxonomy_hash, "usda": nutrient_index.source}
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                index = pickle.load(file)
+            if index.source == source: return index
+        print(f"Building allergen index in {dataset.cache_dir}...")
+        taxonomy = expand_taxonomy(read_taxonomy(taxonomy_path), nutrient_index.descriptions, read_ner_vocabulary(dataset))
+        index = cls(AllergenMatcher(taxonomy), store, source)
+        with open(path, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return index
+
+    def bits(self, allergens: list[str]) -> int:
+        return self.matcher.bits(allergens)
+
+    def rows_without(self, allergens: list[str], rows=None) -> np.ndarray:
+        """ Rows (of the whole dataset by default) whose recipes contain none of the allergens. """
+        rows = np.arange(len(self.recipe_masks)) if rows is None else np.asarray(rows, dtype=np.int64)
+        return rows[(self.recipe_masks[rows] & np.uint32(self.bits(allergens))) == 0]
@@ -1,92 +1,107 @@
 import clingo
 import os
+from utilities.units import UnitRegistry, default_registry # Unit factors shared with the NutritionEngine
 
+# Static part of the nutrition program, grounded once per ResolverFactory: constants and (from config/units.json) unit
+# factors. Recipes are added on top of it as instances of the recipe(r) part below.
 base = """
 
 #const daily_calories = 2000.
 
+#show ingredient/16.
+#show convert/6.
+#show total_ingredient/16.
+#show total_calories/2.
+#show total_carbs/2.
+#show total_protein/2.
+#show total_fat/2.
+#show total_sodium/2.
+#show total_satfat/2.
+#show total_chol/2.
+#show total_sugar/2.
+#show total_calcium/2.
+#show total_iron/2.
+#show total_potassium/2.
+#show total_vitamin_c/2.
+#show total_vitamin_e/2.
+#show total_vitamin_d/2.
+#show carb_pct/2.
+#show protein_pct/2.
+#show fat_pct/2.
+#show satfat_pct/2.
+#show sugar_pct/2.
+#show total_carb_pct/2.
+#show total_protein_pct/2.
+#show total_fat_pct/2.
+#show total_satfat_pct/2.
+#show total_sugar_pct/2.
+"""
+
+# Rules of one recipe r. Every atom carries the recipe as its first argument and only holds while the external
+# active(r) is true, so recipes sharing one Control never see each other's ingredients.
+recipe = """
+#external active(r).
+
 % As the ingredient is added, this introduces a potential allergen
-allergen(N):-ingredient(N, _, _, _, _, _, _, _, _, _, _, _, _, _, _).
+allergen(r, N):-ingredient(r, N, _, _, _, _, _, _, _, _, _, _, _, _, _, _).
 
 % Sum up total nutritional values of selected ingredients
-total_calories(S) :- S = #sum { Cal, N : total_ingredient(N, Cal, _, _, _, _, _, _, _, _, _, _, _, _, _) }.
-total_carbs(S)    :- S = #sum { Carbs, N : total_ingredient(N, _, _, _, Carbs, _, _, _, _, _, _, _, _, _, _) }.
-total_protein(S)  :- S = #sum { P, N : total_ingredient(N, _, P, _, _, _, _, _, _, _, _, _, _, _, _) }.
-total_fat(S)      :- S = #sum { F, N : total_ingredient(N, _, _, F, _, _, _, _, _, _, _, _, _, _, _) }.
-total_sodium(S)   :- S = #sum { Sdm, N : total_ingredient(N, _, _, _, _, Sdm, _, _, _, _, _, _, _, _, _) }.
-total_satfat(S)   :- S = #sum { SF, N : total_ingredient(N, _, _, _, _, _, SF, _, _, _, _, _, _, _, _) }.
-total_chol(S)     :- S = #sum { C, N : total_ingredient(N, _, _, _, _, _, _, C, _, _, _, _, _, _, _) }.
-total_sugar(S)    :- S = #sum { Sug, N : total_ingredient(N, _, _, _, _, _, _, _, Sug, _, _, _, _, _, _) }.
+total_calories(r, S) :- active(r), S = #sum { Cal, N : total_ingredient(r, N, Cal, _, _, _, _, _, _, _, _, _, _, _, _, _) }.
+total_carbs(r, S)    :- active(r), S = #sum { Carbs, N : total_ingredient(r, N, _, _, _, Carbs, _, _, _, _, _, _, _, _, _, _) }.
+total_protein(r, S)  :- active(r), S = #sum { P, N : total_ingredient(r, N, _, P, _, _, _, _, _, _, _, _, _, _, _, _) }.
+total_fat(r, S)      :- active(r), S = #sum { F, N : total_ingredient(r, N, _, _, F, _, _, _, _, _, _, _, _, _, _, _) }.
+total_sodium(r, S)   :- active(r), S = #sum { Sdm, N : total_ingredient(r, N, _, _, _, _, Sdm, _, _, _, _, _, _, _, _, _) }.
+total_satfat(r, S)   :- active(r), S = #sum { SF, N : total_ingredient(r, N, _, _, _, _, _, SF, _, _, _, _, _, _, _, _) }.
+total_chol(r, S)     :- active(r), S = #sum { C, N : total_ingredient(r, N, _, _, _, _, _, _, C, _, _, _, _, _, _, _) }.
+total_sugar(r, S)    :- active(r), S = #sum { Sug, N : total_ingredient(r, N, _, _, _, _, _, _, _, Sug, _, _, _, _, _, _) }.
+total_calcium(r, S)  :- active(r), S = #sum { Ca, N : total_ingredient(r, N, _, _, _, _, _, _, _, _, Ca, _, _, _, _, _) }.
+total_iron(r, S)     :- active(r), S = #sum { Fe, N : total_ingredient(r, N, _, _, _, _, _, _, _, _, _, Fe, _, _, _, _) }.
+total_potassium(r, S) :- active(r), S = #sum { K, N : total_ingredient(r, N, _, _, _, _, _, _, _, _, _, _, K, _, _, _) }.
+total_vitamin_c(r, S) :- active(r), S = #sum { VC, N : total_ingredient(r, N, _, _, _, _, _, _, _, _, _, _, _, VC, _, _) }.
+total_vitamin_e(r, S) :- active(r), S = #sum { VE, N : total_ingredient(r, N, _, _, _, _, _, _, _, _, _, _, _, _, VE, _) }.
+total_vitamin_d(r, S) :- active(r), S = #sum { VD, N : total_ingredient(r, N, _, _, _, _, _, _, _, _, _, _, _, _, _, VD) }.
 
 % Percentage of nutritional metrics in response to calories. 
 %   Other metrics are minerals: no caloric value.
-carb_pct(P)     :- total_calories(T), total_carbs(G), P = (G * 400) / T.
-protein_pct(P)  :- total_calories(T), total_protein(G), P = (G * 400) / T.
-fat_pct(P)      :- total_calories(T), total_fat(G),     P = (G * 900) / T.
-satfat_pct(P)   :- total_calories(T), total_satfat(G),  P = (G * 900) / T.
-sugar_pct(P)    :- total_calories(T), total_sugar(G),   P = (G * 400) / T.
+carb_pct(r, P)     :- total_calories(r, T), total_carbs(r, G), P = (G * 400) / T.
+protein_pct(r, P)  :- total_calories(r, T), total_protein(r, G), P = (G * 400) / T.
+fat_pct(r, P)      :- total_calories(r, T), total_fat(r, G),     P = (G * 900) / T.
+satfat_pct(r, P)   :- total_calories(r, T), total_satfat(r, G),  P = (G * 900) / T.
+sugar_pct(r, P)    :- total_calories(r, T), total_sugar(r, G),   P = (G * 400) / T.
 
 % Percentage of nutritional metrics in response to daily caloric intake. 
 %   Other metrics are minerals: no caloric value.
-total_carb_pct(P)     :- total_carbs(G), P = (G * 400) / daily_calories.
-total_protein_pct(P)  :- total_protein(G), P = (G * 400) / daily_calories.
-total_fat_pct(P)      :- total_fat(G),     P = (G * 900) / daily_calories.
-total_satfat_pct(P)   :- total_satfat(G),  P = (G * 900) / daily_calories.
-total_sugar_pct(P)    :- total_sugar(G),   P = (G * 400) / daily_calories.
-
-% Define conversion factors to grams
-% We'll use integer scaling (values * 1000) since we can't use Python functions.
-%   Essentially grams -> milligrams
-conversion_factor(cup, gram, 236588).
-conversion_factor(tablespoon, gram, 14787).
-conversion_factor(teaspoon, gram, 4929).
-conversion_factor(fluid_ounce, gram, 29574).
-conversion_factor(pint, gram, 473176).
-conversion_factor(quart, gram, 946353).
-conversion_factor(gallon, gram, 3785410).
-
-% Weight measurements; also grams -> milligrams
-conversion_factor(gram, gram, 1000).
-conversion_factor(pound, gram, 453592).
-conversion_factor(ounce, gram, 28350).
-
-% Volume to weight conversion (requires ingredient density)
-convert(Ingredient, Amount, gram, Result, gram) :-
-    ingredient(Ingredient, gram, Amount),
-    Result = Amount.
-
-convert(Ingredient, Amount, FromUnit, Result, ToUnit) :-
-    ingredient(Ingredient, FromUnit, Amount),
-    FromUnit != gram,
-    conversion_factor(FromUnit, ToUnit, VolumeFactor),
-    density(Ingredient, DensityFactor),
+total_carb_pct(r, P)     :- total_carbs(r, G), P = (G * 400) / daily_calories.
+total_protein_pct(r, P)  :- total_protein(r, G), P = (G * 400) / daily_calories.
+total_fat_pct(r, P)      :- total_fat(r, G),     P = (G * 900) / daily_calories.
+total_satfat_pct(r, P)   :- total_satfat(r, G),  P = (G * 900) / daily_calories.
+total_sugar_pct(r, P)    :- total_sugar(r, G),   P = (G * 400) / daily_calories.
+
+% Conversion to grams: unit(Unit, mass, mg per unit) or unit(Unit, volume, ml * 1000 per unit); volumes require
+%   the ingredient's density, added with the recipe (see density_store). Pieces (stick, can, egg) are weighed into grams before they are added.
+convert(r, Ingredient, Amount, Unit, Result, gram) :-
+    ingredient(r, Ingredient, Unit, Amount),
+    unit(Unit, mass, Factor),
+    Result = Amount * Factor / 1000.
+
+convert(r, Ingredient, Amount, Unit, Result, gram) :-
+    ingredient(r, Ingredient, Unit, Amount),
+    unit(Unit, volume, VolumeFactor),
+    density(r, Ingredient, DensityFactor),
     Result = Amount * VolumeFactor * DensityFactor / (1000*1000).
 
 % Scaling predicate of ingredient of total number of actual grams against USDA nutritional values of 100 grams.
 % Due to how ordering matters in predicate definitions, having a Factor = X / 100000 
 %   cannot simplify the predicate as it will be calculated by default as 0, due to no float support.
-total_ingredient(N, Tc, Tp, Ttf, Tcarb, Tsod, Tsf, Tchol, Tsug, Tcal, Tiron, Tpot, Tvitc, Tvite, Tvitd):-
-    convert(N, _, _, X, gram), ingredient(N, Cal, P, Tf, Carb, Sod, Sf, Chol, Sug, Calc, Iron, Pot, Vitc, Vite, Vitd),
+total_ingredient(r, N, Tc, Tp, Ttf, Tcarb, Tsod, Tsf, Tchol, Tsug, Tcal, Tiron, Tpot, Tvitc, Tvite, Tvitd):-
+    convert(r, N, _, _, X, gram), ingredient(r, N, Cal, P, Tf, Carb, Sod, Sf, Chol, Sug, Calc, Iron, Pot, Vitc, Vite, Vitd),
     Tc = Cal * X / 100000, Tp = P * X / 100000, Ttf = Tf * X / 100000, Tcarb = Carb * X / 100000, Tsod = Sod * X / 100000,
     Tsf = Sf * X / 100000, Tchol = Chol * X / 100000, Tsug = Sug * X / 100000, Tcal = Calc * X / 100000,
     Tiron = Iron * X / 100000, Tpot = Pot * X/100000, Tvitc = Vitc * X / 100000, Tvite = Vite * X / 100000, Tvitd = Vitd * X / 100000.
+"""
 
-    
-#show ingredient/15.
-#show total_ingredient/15.
-#show total_calories/1.
-#show total_carbs/1.
-#show total_protein/1.
-#show total_fat/1.
-#show total_sodium/1.
-#show total_satfat/1.
-#show total_chol/1.
-#show total_sugar/1.
-#show carb_pct/1.
-#show protein_pct/1.
-#show fat_pct/1.
-#show satfat_pct/1.
-#show sugar_pct/1.
+# Constraint checks only need the percentages already computed by a nutrition pass (see Recipe.percentages)
+percentages = """
 #show total_carb_pct/1.
 #show total_protein_pct/1.
 #show total_fat_pct/1.
@@ -94,19 +109,105 @@ total_ingredient(N, Tc, Tp, Ttf, Tcarb, Tsod, Tsf, Tchol, Tsug, Tcal, Tiron, Tpo
 #show total_sugar_pct/1.
 """
 
+densities_filepath = os.path.join(os.path.dirname(__file__), "..", "data", "densities_asp.lp")
+
+class ResolverFactory:
+    def __init__(self, recycle_after: int = 256, units: UnitRegistry = None):
+        """ Hands out recipe resolvers sharing one clingo.Control in which the static part of the nutrition program
+            (unit factors) is parsed and grounded only once. Each resolver adds its recipe as a new
+            instance of the recipe(r) part (multi-shot solving), so creating one costs next to nothing.
+            @args:
+                recycle_after : int number of recipes after which a fresh Control is started, so the accumulated
+                                (released) recipe instances do not slow down later solves
+                units : UnitRegistry of the unit factors (default is config/units.json)
+        """
+        self.recycle_after = recycle_after
+        self.units = units
+        self.ctl = None
+        self.count = 0
+        self.next_id = 0
+
+    def new_control(self) -> clingo.Control:
+        ctl = clingo.Control(["--enum-mode=brave", "--warn=none"]) # Recipe atoms are undefined until a recipe is added
+        ctl.add("base", [], base)
+        ctl.add("base", [], (self.units or default_registry()).program)
+        ctl.add("recipe", ["r"], recipe)
+        ctl.ground([("base", [])])
+        return ctl
+
+    def resolver(self) -> 'recipeResolver':
+        if self.ctl is None or self.count >= self.recycle_after:
+            self.ctl = self.new_control()
+            self.count = 0
+        self.count += 1
+        self.next_id += 1
+        return recipeResolver(self.ctl, self.next_id)
+
+_default_factory = None
+
+def default_factory() -> ResolverFactory:
+    """ Factory shared by everything in this process that does not bring its own. """
+    global _default_factory
+    if _default_factory is None: _default_factory = ResolverFactory()
+    return _default_factory
+
 class clingoResolver:
-    def __init__(self):
+    def __init__(self, program: str = percentages, densities: bool = False):
+        """ Resolver with its own clingo.Control, for small standalone programs (see from_percentages).
+            Nutrition is compiled with recipe resolvers from a ResolverFactory instead.
+        """
         # self.ctx = ctx
         self.models = []
-        self.ctl = clingo.Control(["--enum-mode=brave"])
-        self.ctl.add("base", [], base)
+        # Facts added through the backend are invisible to the parser, which would report their #show as undefined
+        self.ctl = clingo.Control(["--enum-mode=brave", "--warn=no-atom-undefined"])
+        self.ctl.add("base", [], program)
 
         # Add the densities from densities_asp.lp
-        with open("E:\Academia\Grad School\Spring'25\CSE505\Project\RecipeRefactorer2\RecipeRefactorer\data\densities_asp.lp", "r") as file:
-            for i, line in enumerate(file):
-                # print(line)
-                self.ctl.add(line)
+        if densities:
+            with open(densities_filepath, "r") as file:
+                self.ctl.add("base", [], file.read())
+
+    @classmethod
+    def from_percentages(cls, recipe):
+        """ Lightweight resolver holding only the total_*_pct facts of an already compiled recipe,
+            so constraints can be checked without redoing the matching or grounding the nutrition program. """
+        resolver = cls(program=percentages, densities=False)
+        resolver.add_facts([resolver.fact(f"total_{metric}_pct", [clingo.Number(value)]) for metric, value in recipe.percentages.items()])
+        return resolver
 
+    def ground(self):
+        self.ctl.ground()
+
+    def fact(self, name: str, arguments: list) -> clingo.Symbol:
+        return clingo.Function(name, arguments)
+
+    def add_facts(self, symbols) -> None:
+        """ Add many facts in one call, as symbols through the backend instead of parsing each one as text. """
+        with self.ctl.backend() as backend:
+            for symbol in symbols:
+                backend.add_rule([backend.add_atom(symbol)])
+
+    def add_ingredients(self, names: list[str], nutrition_values, quantities: list[int] = None, metrics: list[str] = None,
+                        densities: list[int] = None):
+        """ Batch version of add_ingredient_15 and add_ingredient_3: all ingredients of a recipe in one call.
+            @args:
+                names : list of ingredient (USDA description) names
+                nutrition_values : rows of 14 scaled nutritional values, one per name (list of lists or 2-D array)
+                quantities : list of integer quantities, one per name; None skips the ingredient/3 fact of that name
+                metrics : list of units, one per name; None means grams
+                densities : list of densities (g/ml * 1000), one per name; None where the density is unknown
+        """
+        symbols = [self.fact("ingredient", [clingo.String(name), *(clingo.Number(int(v)) for v in values)])
+                   for name, values in zip(names, nutrition_values)]
+        if quantities is not None:
+            for name, quantity, metric in zip(names, quantities, metrics):
+                if quantity is None: continue
+                symbols.append(self.fact("ingredient", [clingo.String(name), clingo.Function(metric or "gram"), clingo.Number(int(quantity))]))
+        if densities is not None:
+            for name, density in dict(zip(names, densities)).items():
+                if density is None: continue
+                symbols.append(self.fact("density", [clingo.String(name), clingo.Number(int(density))]))
+        self.add_facts(symbols)
 
     def add_ingredient_15(self, ingredient_name, nutrition_values): # ingredient is a tuple[str, int*14]
         # Add the ingredient to the ASP program
@@ -144,11 +245,11 @@ class clingoResolver:
             self.models = m.symbols(shown=True)
             return m, True
 
-    def resolve(self):
+    def resolve(self, assumptions: list = None):
 
         # INGREDIENTS FIRST, THEN CONSTRAINTS
 
-        with self.ctl.solve(on_model=self.on_model, on_core=lambda m: print("Violations: {}".format(m)), yield_=True) as result:
+        with self.ctl.solve(assumptions=assumptions or [], on_model=self.on_model, on_core=lambda m: print("Violations: {}".format(m)), yield_=True) as result:
             if isinstance(result, clingo.SolveHandle):
                 if result.get().unsatisfiable:
                     # print("HANDLE CONFLICT ON: ", result.core())
@@ -162,4 +263,74 @@ class clingoResolver:
                     return result.core(), False
                 else:
                     for m in result: print("Returning SolveResult Answer: {}".format(m))
-                    return result, True
\ No newline at end of file
+                    return result, True
+
+class recipeResolver(clingoResolver):
+    def __init__(self, ctl: clingo.Control, id: int):
+        """ Resolver for one recipe on a Control shared through a ResolverFactory; use ResolverFactory.resolver().
+            Facts are collected and added on ground(): symbols from add_facts() through the backend, text facts from
+            add_ingredient_15() and friends as the part facts_<id>; both are grounded together with recipe(<id>).
+            models holds the shown symbols of this recipe only, without the recipe argument, as a standalone
+            resolver would have them.
+        """
+        self.models = []
+        self.ctl = ctl
+        self.id = id
+        self.active = clingo.Function("active", [clingo.Number(id)])
+        self.facts : list[str] = []
+        self.symbols : list[clingo.Symbol] = []
+        self.parts : list[str] = ["recipe"] # Parameterized parts instantiated for this recipe on ground()
+
+    def fact(self, name: str, arguments: list) -> clingo.Symbol:
+        return clingo.Function(name, [clingo.Number(self.id), *arguments])
+
+    def add_facts(self, symbols) -> None:
+        # Written through the backend on ground(), once active(<id>) can be declared
+        self.symbols.extend(symbols)
+
+    def add(self, clingo_predicate: str):
+        # Facts only hold while this recipe is active
+        self.facts.append(f"{clingo_predicate[:-1]} :- active({self.id}).")
+
+    def add_ingredient_15(self, ingredient_name, nutrition_values):
+        self.add(f"ingredient({self.id}, \"{ingredient_name}\", {', '.join(str(v) for v in nutrition_values)}).")
+
+    def add_ingredient_3(self, ingredient_name, ingredient_quantity, ingredient_metric):
+        if ingredient_metric == None: ingredient_metric = "gram"
+        self.add(f"ingredient({self.id}, \"{ingredient_name}\", {ingredient_metric}, {ingredient_quantity}).")
+
+    def add_pct_1(self, nutrition_metric, value):
+        self.add(f"total_{nutrition_metric}_pct({self.id}, {value}).")
+
+    def add_allergen(self, allergen: str):
+        self.facts.append(f":-allergen({self.id}, \"{allergen}\").")
+
+    def ground(self):
+        with self.ctl.backend() as backend:
+            active = backend.add_atom(self.active)
+            backend.add_external(active, clingo.TruthValue.False_)
+            for symbol in self.symbols:
+                backend.add_rule([backend.add_atom(symbol)], [active])
+        parts = [(part, [clingo.Number(self.id)]) for part in self.parts]
+        if len(self.facts): # Facts added one at a time as text
+            part = f"facts_{self.id}"
+            self.ctl.add(part, [], "\n".join(self.facts))
+            parts.append((part, []))
+        self.ctl.ground(parts)
+
+    def on_model(self, m):
+        self.models = [clingo.Function(symbol.name, symbol.arguments[1:]) for symbol in m.symbols(shown=True)
+                       if symbol.arguments and symbol.arguments[0] == clingo.Number(self.id)]
+        return m, True
+
+    def resolve(self, assumptions: list = None, release: bool = True):
+        """ Solve with this recipe active; release=False keeps it active for further solves (see release()). """
+        self.ctl.assign_external(self.active, True)
+        try:
+            return super().resolve(assumptions)
+        finally:
+            if release: self.release()
+
+    def release(self):
+        # Released for good: this recipe's atoms become false and drop out of every later solve
+        self.ctl.release_external(self.active)
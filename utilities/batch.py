@@ -0,0 +1,52 @@
+import json
+import time
+from utilities.pipeline import Resources, refactor
+from utilities.parallel import RecipePool # Worker processes for batches of queries
+from utilities.writers import open_writer # JSONL, text, SQLite or Parquet results, written in buffered bulk
+
+def answer(resources: Resources, query: dict) -> dict:
+    """ Result of one query, {"dish": ..., "specified_constraints": {...}, "substitute": bool}; errors are reported, not raised. """
+    result = {"id": query.get("id"), "query": query.get("dish"), "specified_constraints": query.get("specified_constraints", {})}
+    try:
+        result.update(refactor(resources, query["dish"], result["specified_constraints"], substitute_ingredients=query.get("substitute", False)))
+    except Exception as e:
+        result.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    return result
+
+def answer_line(resources: Resources, line_number: int, line: str) -> dict:
+    """ Result of one line of a queries file; the id defaults to the line number. """
+    try:
+        query = json.loads(line)
+    except json.JSONDecodeError as e:
+        result = {"status": "error", "error": f"Line {line_number}: {e}"}
+    else:
+        result = answer(resources, query)
+    if result.get("id") is None: result["id"] = line_number
+    return result
+
+def run_batch(resources: Resources, queries_path: str, output_path: str, workers: int = None, output_format: str = None, append: bool = False) -> dict:
+    """ Answer every query of a JSONL file with the same, already loaded, resources and write one result per query.
+        @args:
+            resources : Resources shared by all queries
+            queries_path : str path to the queries, one {"dish": ..., "specified_constraints": {...}} object per line
+            output_path : str path to write the results to
+            workers : int number of worker processes answering queries in parallel (default is this process only)
+            output_format : str "jsonl", "text", "sqlite" or "parquet" (default is given by the extension of output_path)
+            append : bool, whether to add the results to an existing output instead of replacing it
+        @return:
+            dict - Number of queries per result status, and the elapsed time.
+    """
+    stats = {}
+    start = time.perf_counter()
+    pool = RecipePool(resources, workers) if workers is not None and workers > 1 else None
+    with open(queries_path, 'r', encoding='utf-8') as queries, open_writer(output_path, output_format, append=append) as output:
+        # Queries are read and answered one at a time (a pool works a bounded window ahead); results are written in buffers
+        lines = ((line_number, line) for line_number, line in enumerate(queries, start=1) if line.strip())
+        if pool is not None: results = pool.answer(lines) # Results stay in the order of the queries
+        else: results = (answer_line(resources, line_number, line) for line_number, line in lines)
+        for result in results:
+            output.write(result)
+            stats[result["status"]] = stats.get(result["status"], 0) + 1
+    if pool is not None: pool.close()
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
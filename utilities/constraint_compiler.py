@@ -0,0 +1,153 @@
+import os
+import json
+import clingo
+import numpy as np
+from models.classes import Recipe
+from utilities.asp import ResolverFactory, recipeResolver
+from utilities.nutrition_engine import PERCENTAGE_RULES
+
+constraints_filepath = os.path.join(os.path.dirname(__file__), "..", "config", "constraints.json")
+# Column of each percentage in NutritionTable.percentages and NutritionEngine results
+PERCENTAGE_COLUMNS = {metric: column for column, (metric, _, _) in enumerate(PERCENTAGE_RULES)}
+
+# Shown atoms of a constraint resolver; everything else is an integrity constraint
+show = "\n".join(f"#show total_{metric}_pct/2." for metric in PERCENTAGE_COLUMNS)
+
+class Condition:
+    def __init__(self, name: str, variant: str, bounds: dict[str, dict], id: int):
+        """ One condition (or variant of a condition) of config/constraints.json, compiled.
+            @args:
+                name : str name of the constraint ("Diabetes")
+                variant : str variant ("Type 2"), or None for constraints without variants
+                bounds : dict of percentage metric -> {"min": int, "max": int}, either bound optional
+                id : int number of the condition; names its solver part and its check/1 external
+        """
+        self.name = name
+        self.variant = variant
+        self.bounds = bounds
+        self.part = f"condition_{id}"
+        # Assumed true for the solves that check this condition, false otherwise
+        self.check = clingo.Function("check", [clingo.Number(id)])
+        # Integrity constraints of the part; r is the recipe the part is instantiated for. A recipe without the
+        # percentage (its nutrition was not resolved) cannot be shown to be within the bounds, so it violates them
+        rules = []
+        for metric, bound in bounds.items():
+            rules.append(f":- check({id}), active(r), not total_{metric}_pct(r, _).")
+            if "max" in bound: rules.append(f":- check({id}), active(r), total_{metric}_pct(r, P), P > {int(bound['max'])}.")
+            if "min" in bound: rules.append(f":- check({id}), active(r), total_{metric}_pct(r, P), P < {int(bound['min'])}.")
+        self.program = "\n".join(rules)
+
+    def mask(self, percentages: np.ndarray) -> np.ndarray:
+        """ Vectorized bounds of the condition: which rows of a (recipes x 5) percentage matrix satisfy it. Every row of
+            a percentage matrix has been computed (see NutritionEngine), so only the bounds are compared. """
+        mask = np.ones(len(percentages), dtype=np.bool_)
+        for metric, bound in self.bounds.items():
+            column = percentages[:, PERCENTAGE_COLUMNS[metric]]
+            if "max" in bound: mask &= column <= bound["max"]
+            if "min" in bound: mask &= column >= bound["min"]
+        return mask
+
+class ConstraintCompiler(ResolverFactory):
+    def __init__(self, constraint_data: dict, recycle_after: int = 256):
+        """ Compiles the bounds of config/constraints.json once into Conditions: solver parts that are parsed once per
+            Control and instantiated per recipe (see ResolverFactory), and the equivalent NumPy masks.
+            Every condition is guarded by a check/1 external, so all conditions of a recipe are grounded together, once,
+            and each solve picks the conditions it checks through its assumptions.
+            Constraints without bounds (Allergen) are not numeric and compile to nothing.
+            @args:
+                constraint_data : dict of config/constraints.json
+                recycle_after : int number of recipes after which a fresh Control is started
+            @raise:
+                ValueError - On bounds of an unknown variant or percentage.
+        """
+        super().__init__(recycle_after)
+        self.conditions : dict[tuple[str, str], Condition] = {}
+        for constraint in constraint_data["constraints"]:
+            if "bounds" not in constraint: continue
+            variants = constraint.get("variants")
+            by_variant = constraint["bounds"] if variants else {None: constraint["bounds"]}
+            for variant, bounds in by_variant.items():
+                if variants and variant not in variants: raise ValueError(f"Bounds of unknown {constraint['name']} variant: {variant}")
+                for metric in bounds:
+                    if metric not in PERCENTAGE_COLUMNS: raise ValueError(f"Unknown percentage in the bounds of {constraint['name']}: {metric}")
+                self.conditions[(constraint["name"], variant)] = Condition(constraint["name"], variant, bounds, len(self.conditions))
+
+    @classmethod
+    def open(cls, path: str = constraints_filepath) -> 'ConstraintCompiler':
+        with open(path, 'r') as file:
+            return cls(json.load(file))
+
+    def new_control(self) -> clingo.Control:
+        ctl = clingo.Control(["--enum-mode=brave", "--warn=none"]) # Percentages are undefined until a recipe is added
+        ctl.add("base", [], show)
+        # Free: neither true nor false unless a solve assumes it, so unchecked conditions never get in the way
+        ctl.add("base", [], "\n".join(f"#external {condition.check}. [free]" for condition in self.conditions.values()))
+        for condition in self.conditions.values():
+            ctl.add(condition.part, ["r"], condition.program)
+        ctl.ground([("base", [])])
+        return ctl
+
+    def conditions_for(self, constraint: str, variants) -> list[Condition]:
+        """ Compiled conditions of a specified constraint: {"Diabetes": "Type 2"}, {"Hypertension": []} and so on. """
+        if (constraint, None) in self.conditions: return [self.conditions[(constraint, None)]]
+        variants = [variants] if type(variants) == str else variants
+        return [self.conditions[(constraint, variant)] for variant in variants if (constraint, variant) in self.conditions]
+
+    def resolver(self, recipe: Recipe = None, conditions: list[Condition] = ()) -> recipeResolver:
+        """ Resolver holding the total_*_pct facts of a compiled recipe and instantiating the parts of the conditions. """
+        resolver = super().resolver()
+        resolver.parts = [condition.part for condition in conditions]
+        if recipe is not None:
+            resolver.add_facts([resolver.fact(f"total_{metric}_pct", [clingo.Number(value)]) for metric, value in recipe.percentages.items()])
+        return resolver
+
+    def conditions_of(self, specified_constraints: dict) -> list[Condition]:
+        return [condition for constraint, variants in specified_constraints.items() for condition in self.conditions_for(constraint, variants)]
+
+    def solve(self, recipe: Recipe, specified_constraints: dict) -> tuple[bool, list[Condition]]:
+        """ Check every specified condition with one grounding and one solve, all check/1 externals assumed true.
+            @return:
+                tuple - (True if no condition is violated, the conditions in the unsatisfiable core otherwise)
+        """
+        conditions = self.conditions_of(specified_constraints)
+        if not len(conditions): return True, []
+        resolver = self.resolver(recipe, conditions)
+        resolver.ground()
+        core, flag = resolver.resolve(assumptions=[(condition.check, True) for condition in conditions])
+        if flag: return True, []
+        return False, self.core_conditions(core, conditions)
+
+    def violations(self, recipe: Recipe, specified_constraints: dict) -> list[Condition]:
+        """ Every violated condition: one grounding, then one solve per condition assuming only its check/1 external. """
+        conditions = self.conditions_of(specified_constraints)
+        if not len(conditions): return []
+        resolver = self.resolver(recipe, conditions)
+        resolver.ground()
+        violated = []
+        try:
+            for condition in conditions:
+                core, flag = resolver.resolve(assumptions=[(condition.check, True)], release=False)
+                if not flag: violated.append(condition)
+        finally:
+            resolver.release()
+        return violated
+
+    def core_conditions(self, core: list[int], conditions: list[Condition]) -> list[Condition]:
+        """ Conditions whose check/1 literal is in an unsatisfiable core (see the on_core hook of clingoResolver.resolve). """
+        literals = set(core)
+        return [condition for condition in conditions if self.ctl.symbolic_atoms[condition.check].literal in literals]
+
+    def mask(self, percentages: np.ndarray, specified_constraints: dict) -> np.ndarray:
+        """ Which rows of a (recipes x 5) percentage matrix satisfy every specified condition. """
+        mask = np.ones(len(percentages), dtype=np.bool_)
+        for constraint, variants in specified_constraints.items():
+            for condition in self.conditions_for(constraint, variants): mask &= condition.mask(percentages)
+        return mask
+
+_default_compiler : ConstraintCompiler = None
+
+def default_compiler() -> ConstraintCompiler:
+    """ Compiler of config/constraints.json shared by everything in this process that does not bring its own. """
+    global _default_compiler
+    if _default_compiler is None: _default_compiler = ConstraintCompiler.open()
+    return _default_compiler
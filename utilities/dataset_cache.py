@@ -0,0 +1,139 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Columns of the RecipeNLG dataset that the refactorer actually reads
+CACHE_COLUMNS = ['title', 'ingredients', 'NER']
+CACHE_VERSION = 1
+META_FILE = "meta.json"
+
+def default_cache_dir(csv_path: str) -> str:
+    """ Cache directory used for a dataset when none is given: a 'cache' folder next to the .csv file. """
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), "cache")
+
+def source_signature(csv_path: str) -> dict:
+    """ Size and modification time of the source file; any change to either invalidates the cache. """
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+class StringColumn:
+    def __init__(self, blob_path: str, offsets_path: str):
+        """ Memory-mapped column of variable length strings, stored as one UTF-8 byte blob and an offsets array.
+            Row i spans blob[offsets[i]:offsets[i+1]]; nothing is decoded until the row is requested.
+            @args:
+                blob_path : str path to the raw UTF-8 bytes of the column
+                offsets_path : str path to the .npy file of int64 row offsets into the blob
+        """
+        self.offsets = np.load(offsets_path, mmap_mode='r')
+        if os.path.getsize(blob_path): self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        else: self.blob = np.empty(0, dtype=np.uint8) # np.memmap refuses empty files
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+    def tolist(self) -> list[str]:
+        """ Decode the whole column at once; much faster than indexing row by row. """
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+class StringColumnWriter:
+    def __init__(self, blob_path: str):
+        """ Appends strings to a blob file while recording their offsets; see StringColumn for the layout. """
+        self.file = open(blob_path, 'wb')
+        self.offsets : list[int] = [0]
+
+    def extend(self, strings) -> None:
+        for s in strings:
+            data = s.encode('utf-8')
+            self.file.write(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self, offsets_path: str) -> None:
+        self.file.close()
+        np.save(offsets_path, np.asarray(self.offsets, dtype=np.int64))
+
+def is_fresh(csv_path: str, cache_dir: str) -> bool:
+    """ Check whether the cache in cache_dir was built from the current version of csv_path. """
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if not os.path.isfile(meta_path): return False
+    with open(meta_path, 'r') as file:
+        meta = json.load(file)
+    return meta.get("version") == CACHE_VERSION and meta.get("source") == source_signature(csv_path)
+
+def ingest(csv_path: str, cache_dir: str = None, chunksize: int = 100_000) -> str:
+    """ One-time conversion of the RecipeNLG .csv into memory-mappable columns.
+        The .csv is streamed in chunks so the full dataset is never held in memory.
+        @args:
+            csv_path : str path to full_dataset.csv
+            cache_dir : str directory to write the cache to (default is default_cache_dir(csv_path))
+            chunksize : int number of rows parsed per chunk
+        @return:
+            str - The cache directory.
+    """
+    cache_dir = cache_dir or default_cache_dir(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if os.path.isfile(meta_path): os.remove(meta_path) # Invalidate first so an interrupted ingest is never read
+
+    signature = source_signature(csv_path)
+    writers = {column: StringColumnWriter(os.path.join(cache_dir, f"{column}.bin")) for column in CACHE_COLUMNS}
+    rows = 0
+    for chunk in pd.read_csv(csv_path, usecols=CACHE_COLUMNS, dtype=str, keep_default_na=False, chunksize=chunksize):
+        for column in CACHE_COLUMNS:
+            writers[column].extend(chunk[column].tolist())
+        rows += len(chunk)
+    for column, writer in writers.items():
+        writer.close(os.path.join(cache_dir, f"{column}.offsets.npy"))
+
+    with open(meta_path, 'w') as file:
+        json.dump({"version": CACHE_VERSION, "source": signature, "rows": rows, "columns": CACHE_COLUMNS}, file)
+    return cache_dir
+
+class RecipeDataset:
+    def __init__(self, cache_dir: str):
+        """ Read-only view over an ingested RecipeNLG cache. Columns are memory-mapped; rows are decoded on demand.
+            @args:
+                cache_dir : str directory written by ingest()
+        """
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, META_FILE), 'r') as file:
+            self.meta = json.load(file)
+        self.columns : dict[str, StringColumn] = {
+            column: StringColumn(os.path.join(cache_dir, f"{column}.bin"), os.path.join(cache_dir, f"{column}.offsets.npy"))
+            for column in self.meta["columns"]
+        }
+        self._titles = None
+
+    @classmethod
+    def open(cls, csv_path: str, cache_dir: str = None) -> 'RecipeDataset':
+        """ Open the cache for csv_path, (re)building it first if it is missing or stale. """
+        cache_dir = cache_dir or default_cache_dir(csv_path)
+        if not is_fresh(csv_path, cache_dir):
+            print(f"Building dataset cache in {cache_dir}...")
+            ingest(csv_path, cache_dir)
+        return cls(cache_dir)
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def title(self, i: int) -> str:
+        return self.columns['title'][i]
+
+    def ingredients(self, i: int) -> str:
+        """ String representation of the list of ingredient lines (with quantities) for row i. """
+        return self.columns['ingredients'][i]
+
+    def ner(self, i: int) -> str:
+        """ String representation of the list of bare ingredient names for row i. """
+        return self.columns['NER'][i]
+
+    def titles(self) -> list[str]:
+        """ All titles, decoded once and kept for subsequent calls. """
+        if self._titles is None: self._titles = self.columns['title'].tolist()
+        return self._titles
@@ -0,0 +1,77 @@
+import os
+import re
+from collections import Counter
+from utilities.nutrient_index import normalize_ingredient
+
+data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+# Density files, most trusted first, and the factor that brings each to g/ml * 1000
+density_sources = [
+    (os.path.join(data_dir, "densities_asp.lp"), 1),
+    (os.path.join(data_dir, "..", "cleaned.lp"), 1),
+    (os.path.join(data_dir, "densities.txt"), 1000),
+    (os.path.join(data_dir, "densities_2.txt"), 1),
+]
+
+# density("Ingredient", Value). facts; descriptions may hold escaped or raw quotes ('1/8" FAT'), so the description
+# runs to the last '", ' before the value
+density_fact = re.compile(r'\s*density\("(.*)",\s*(-?\d+(?:\.\d+)?)\)\.\s*$')
+
+def read_density_facts(path: str, scale: int = 1) -> list[tuple[str, int]]:
+    """ (ingredient, density * scale) of the density("Ingredient", Value) facts of a file, in file order.
+        Lines that mention density but cannot be parsed are counted and reported. """
+    facts, skipped = [], 0
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            match = density_fact.match(line)
+            if match: facts.append((match.group(1).replace('\\"', '"'), int(round(float(match.group(2)) * scale))))
+            elif "density(" in line and not line.lstrip().startswith("%"): skipped += 1
+    if skipped: print(f"Skipped {skipped} unparsable density facts in {path}")
+    return facts
+
+class DensityStore:
+    def __init__(self, sources: list[tuple[str, int]] = density_sources):
+        """ Densities (g/ml * 1000) of every density file, deduplicated into one dict keyed by the normalized
+            USDA description; the first file that lists a description wins. Descriptions without their own density
+            fall back, in order, to:
+            - their longest comma prefix with one ("cheese,cheddar,sharp" -> "cheese,cheddar")
+            - their category, the first comma token ("cheese,*"): the most common density of its descriptions
+            - the head word of the category ("wheat flour" -> "flour"), for the generic entries
+            @args:
+                sources : list of (path, scale) of the density files, most trusted first; missing files are skipped
+        """
+        self.sources = [path for path, _ in sources if os.path.isfile(path)]
+        self.densities : dict[str, int] = {}
+        for path, scale in sources:
+            if not os.path.isfile(path): continue
+            for ingredient, density in read_density_facts(path, scale):
+                if density > 0: self.densities.setdefault(normalize_ingredient(ingredient), density)
+        values : dict[str, Counter] = {}
+        for ingredient, density in self.densities.items():
+            if "," in ingredient: values.setdefault(ingredient.split(",")[0], Counter())[density] += 1
+        self.categories : dict[str, int] = {category: counter.most_common(1)[0][0] for category, counter in values.items()}
+        self._resolved : dict[str, int] = {} # Lookups with their fallbacks, memoized
+
+    def __len__(self) -> int:
+        return len(self.densities)
+
+    def density(self, description: str) -> int:
+        """ Density of a USDA description, with the fallbacks above; None if nothing applies. """
+        key = normalize_ingredient(description)
+        if key in self._resolved: return self._resolved[key]
+        tokens = key.split(",")
+        density = None
+        for n in range(len(tokens), 0, -1):
+            density = self.densities.get(",".join(tokens[:n]))
+            if density is not None: break
+        if density is None: density = self.categories.get(tokens[0])
+        if density is None and tokens[0]: density = self.densities.get(tokens[0].split()[-1])
+        self._resolved[key] = density
+        return density
+
+_default_store : DensityStore = None
+
+def default_store() -> DensityStore:
+    """ Store of the density files shared by everything in this process that does not bring its own. """
+    global _default_store
+    if _default_store is None: _default_store = DensityStore()
+    return _default_store
@@ -0,0 +1,109 @@
+import os
+import ast # To convert string of a list from the Kaggle dataset to a list
+import json
+import numpy as np
+from models.classes import Recipe
+from utilities.parsing import parse_ingredient
+from utilities.dataset_cache import RecipeDataset, StringColumn, StringColumnWriter
+
+STORE_VERSION = 1
+STORE_PREFIX = "store"
+
+class IngredientStore:
+    def __init__(self, cache_dir: str):
+        """ Array-backed table of every recipe's ingredient lines, parsed once into (ingredient, quantity, metric) records.
+            Records of recipe row r span offsets[r]:offsets[r+1]. Ingredient names and units are stored once each in
+            vocabularies and referenced by id, so the table stays compact and memory-mapped.
+            @args:
+                cache_dir : str directory written by IngredientStore.build()
+        """
+        def path(name): return os.path.join(cache_dir, f"{STORE_PREFIX}.{name}")
+        with open(path("meta.json"), 'r') as file:
+            self.meta = json.load(file)
+        self.units : list[str] = self.meta["units"]
+        self.offsets = np.load(path("offsets.npy"), mmap_mode='r')
+        self.quantity = np.load(path("quantity.npy"), mmap_mode='r')
+        self.unit = np.load(path("unit.npy"), mmap_mode='r')
+        self.ingredient = np.load(path("ingredient.npy"), mmap_mode='r')
+        self.parsed = np.load(path("parsed.npy"), mmap_mode='r')
+        self.vocabulary = StringColumn(path("vocabulary.bin"), path("vocabulary.offsets.npy"))
+        self.allergens = None # AllergenIndex of the store; recipes then carry their allergen mask
+
+    @staticmethod
+    def is_fresh(dataset: RecipeDataset) -> bool:
+        meta_path = os.path.join(dataset.cache_dir, f"{STORE_PREFIX}.meta.json")
+        if not os.path.isfile(meta_path): return False
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+        return meta.get("version") == STORE_VERSION and meta.get("source") == dataset.meta["source"]
+
+    @classmethod
+    def build(cls, dataset: RecipeDataset) -> 'IngredientStore':
+        """ Offline pipeline stage: parse the ingredient lines of every recipe in the dataset into the store.
+            @args:
+                dataset : RecipeDataset whose cache directory the store is written next to
+            @return:
+                IngredientStore - The freshly built store.
+        """
+        def path(name): return os.path.join(dataset.cache_dir, f"{STORE_PREFIX}.{name}")
+        if os.path.isfile(path("meta.json")): os.remove(path("meta.json"))
+
+        vocabulary : dict[str, int] = {}
+        units : dict[str, int] = {'': 0}
+        offsets, quantities, unit_ids, ingredient_ids, parsed = [0], [], [], [], []
+        column = dataset.columns['ingredients']
+        for row in range(len(dataset)):
+            lines = ast.literal_eval(column[row])
+            for line in lines:
+                ingredient, quantity, metric = parse_ingredient(line)
+                parsed.append(quantity is not None or metric is not None)
+                quantities.append(np.nan if quantity is None else quantity)
+                unit_ids.append(units.setdefault(metric or '', len(units)))
+                ingredient_ids.append(vocabulary.setdefault(ingredient, len(vocabulary)))
+            offsets.append(offsets[-1] + len(lines))
+
+        writer = StringColumnWriter(path("vocabulary.bin"))
+        writer.extend(vocabulary) # Dictionaries keep insertion order, so position == id
+        writer.close(path("vocabulary.offsets.npy"))
+        np.save(path("offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        np.save(path("quantity.npy"), np.asarray(quantities, dtype=np.float64))
+        np.save(path("unit.npy"), np.asarray(unit_ids, dtype=np.int16))
+        np.save(path("ingredient.npy"), np.asarray(ingredient_ids, dtype=np.int32))
+        np.save(path("parsed.npy"), np.asarray(parsed, dtype=np.bool_))
+        with open(path("meta.json"), 'w') as file:
+            json.dump({"version": STORE_VERSION, "source": dataset.meta["source"], "units": list(units)}, file)
+        return cls(dataset.cache_dir)
+
+    @classmethod
+    def open(cls, dataset: RecipeDataset) -> 'IngredientStore':
+        """ Open the store built for dataset, building it first if it is missing or stale. """
+        if not cls.is_fresh(dataset):
+            print(f"Parsing ingredients into {dataset.cache_dir}...")
+            return cls.build(dataset)
+        return cls(dataset.cache_dir)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def records(self, row: int) -> list[tuple[str, float, str]]:
+        """ Parsed (ingredient, quantity, metric) records of one recipe row, in recipe order.
+            Lines the quantity regex did not match have neither quantity nor metric (None), as when parsed live.
+        """
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        records = []
+        for i in range(start, end):
+            ingredient = self.vocabulary[int(self.ingredient[i])]
+            if not self.parsed[i]: records.append((ingredient, None, None))
+            else:
+                quantity = float(self.quantity[i])
+                records.append((ingredient, None if np.isnan(quantity) else quantity, self.units[int(self.unit[i])]))
+        return records
+
+    def recipe(self, row: int, dish: str) -> Recipe:
+        """ Build the Recipe for a dataset row straight from the stored records. """
+        recipe_sheet = Recipe(dish=dish)
+        recipe_sheet.row = row
+        for ingredient, quantity, metric in self.records(row):
+            recipe_sheet.add(ingredient, quantity, metric)
+        if self.allergens is not None: recipe_sheet.allergens = int(self.allergens.recipe_masks[row])
+        return recipe_sheet
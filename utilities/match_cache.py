@@ -0,0 +1,102 @@
+import os
+import json
+import sqlite3
+from collections import OrderedDict
+from utilities.nutrient_index import NutrientIndex, normalize_ingredient
+
+class MatchCache:
+    def __init__(self, index: NutrientIndex, maxsize: int = 4096, path: str = None, flush_every: int = 64):
+        """ Bounded LRU cache of ingredient -> USDA matches in front of a NutrientIndex, optionally persisted to SQLite
+            so that warm runs skip rapidfuzz for every ingredient seen before.
+            Use match() as a drop-in for NutrientIndex.match().
+            @args:
+                index : NutrientIndex that resolves cache misses
+                maxsize : int maximum number of matches kept in memory
+                path : str SQLite file to persist matches to (default is no persistence)
+                flush_every : int number of new matches buffered before they are written to the file
+        """
+        self.index = index
+        self.maxsize = maxsize
+        self.path = path
+        self.flush_every = flush_every
+        self.entries : OrderedDict[str, tuple[str, float, int]] = OrderedDict()
+        self.pending : list[tuple[str, str, float, int]] = []
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._pid = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """ Connection to the persistent store, opened lazily (and reopened in forked worker processes). """
+        if self.path is None: return None
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path)
+            self._pid = os.getpid()
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS matches (name TEXT PRIMARY KEY, description TEXT, score REAL, row INTEGER)")
+            # Matches are only valid for the USDA table they were made against
+            source = json.dumps(self.index.source, sort_keys=True)
+            stored = self._db.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            if stored is None or stored[0] != source:
+                self._db.execute("DELETE FROM matches")
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (source,))
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, match: tuple[str, float, int]) -> None:
+        self.entries[key] = match
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize: self.entries.popitem(last=False)
+
+    def get(self, ingredient: str) -> tuple[str, float, int]:
+        """ Cached match of an ingredient, from memory or the persistent store; None (a miss) if it was never matched. """
+        key = normalize_ingredient(ingredient)
+        match = self.entries.get(key)
+        if match is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return match
+        if self.db is not None:
+            row = self.db.execute("SELECT description, score, row FROM matches WHERE name = ?", (key,)).fetchone()
+            if row is not None:
+                match = (row[0], row[1], row[2])
+                self._remember(key, match)
+                self.hits += 1
+                return match
+        self.misses += 1
+        return None
+
+    def put(self, ingredient: str, match: tuple[str, float, int]) -> None:
+        key = normalize_ingredient(ingredient)
+        self._remember(key, match)
+        if self.path is not None:
+            self.pending.append((key, *match))
+            if len(self.pending) >= self.flush_every: self.flush()
+
+    def match(self, ingredient: str) -> tuple[str, float, int]:
+        """ Same as NutrientIndex.match(), but every ingredient is only matched once. """
+        match = self.get(ingredient)
+        if match is None:
+            match = self.index.match(ingredient)
+            if match is not None: self.put(ingredient, match)
+        return match
+
+    def nutrition_values(self, row: int) -> list[int]:
+        return self.index.nutrition_values(row)
+
+    def flush(self) -> None:
+        """ Write buffered matches to the persistent store. """
+        if not len(self.pending) or self.db is None: return
+        self.db.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?)", self.pending)
+        self.db.commit()
+        self.pending = []
+
+    def close(self) -> None:
+        self.flush()
+        if self._db is not None and self._pid == os.getpid(): self._db.close()
+        self._db = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "size": len(self.entries)}
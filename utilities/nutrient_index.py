@@ -0,0 +1,90 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import rapidfuzz # Utilized for fuzzy string matching recipes and ingredients
+from utilities.dataset_cache import default_cache_dir, source_signature
+
+INDEX_VERSION = 1
+INDEX_FILE = "nutrient_index.pkl"
+
+def normalize_ingredient(ingredient: str) -> str:
+    """ Lower case ingredient name with single spaces; names equal after normalization resolve to the same match. """
+    return " ".join(ingredient.lower().split())
+
+class NutrientIndex:
+    def __init__(self, nutrition_data: pd.DataFrame, source: dict = None):
+        """ Normalized USDA descriptions with a token -> row inverted index and the nutrient matrix, so that an
+            ingredient resolves to its USDA row without rebuilding or scanning the description column.
+            @args:
+                nutrition_data : DataFrame of USDA.csv (ID, Description, then the 14 nutrient columns)
+                source : dict signature of the .csv the data comes from; used to detect a stale index
+        """
+        self.source = source
+        self.descriptions : list[str] = nutrition_data['Description'].str.lower().str.strip().tolist()
+        self.columns : list[str] = nutrition_data.columns.tolist()[2:]
+        self.values = nutrition_data.iloc[:, 2:].fillna(0).to_numpy(dtype=np.float64) # Missing nutrients count as 0
+        # Descriptions are comma separated ("butter,whipped,with salt"); index every comma token
+        tokens : dict[str, list[int]] = {}
+        for row, description in enumerate(self.descriptions):
+            for token in set(description.split(",")):
+                if token: tokens.setdefault(token, []).append(row)
+        self.tokens : dict[str, np.ndarray] = {token: np.asarray(rows, dtype=np.int32) for token, rows in tokens.items()}
+
+    @classmethod
+    def open(cls, csv_path: str, cache_dir: str = None) -> 'NutrientIndex':
+        """ Load the index saved for csv_path, building and saving it first if it is missing or stale. """
+        cache_dir = cache_dir or default_cache_dir(csv_path)
+        path = os.path.join(cache_dir, INDEX_FILE)
+        source = {"version": INDEX_VERSION, **source_signature(csv_path)}
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                index = pickle.load(file)
+            if index.source == source: return index
+        index = cls(pd.read_csv(csv_path), source)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.descriptions)
+
+    def candidates(self, tokens: list[str]) -> np.ndarray:
+        """ Rows whose description contains any of the given comma tokens, in table order. """
+        postings = [self.tokens[token] for token in tokens if token in self.tokens]
+        if not len(postings): return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(postings))
+
+    def match(self, ingredient: str) -> tuple[str, float, int]:
+        """ Find the USDA description that best matches an ingredient of a recipe.
+            "egg" vs "egg,scrambled, cooked" vs "egg, boiled": single words are scored with partial_ratio,
+            multi-word names are reversed into USDA order ("cheddar cheese" -> "cheese,cheddar") and scored with WRatio.
+            Only descriptions containing one of the ingredient's words as a comma token are scored; if there are
+            none, every description is.
+            @args:
+                ingredient : str name of the ingredient as it appears in the recipe
+            @return:
+                tuple - (matched description, score, row), or None if the table is empty
+        """
+        ### Preprocessing of string representation of the ingredient to make it more compatible with USDA dataset
+        ingredient_name = normalize_ingredient(ingredient).replace(" ", ",")
+        ingredient_descriptions = ingredient_name.split(",")
+        if len(ingredient_descriptions) == 1: # If the ingredient is a single word
+            scorer = rapidfuzz.fuzz.partial_ratio
+        else: # If the ingredient is a multi-word description
+            ingredient_descriptions.reverse()
+            ingredient_name = ",".join(ingredient_descriptions)
+            scorer = rapidfuzz.fuzz.WRatio
+
+        rows = self.candidates(ingredient_descriptions)
+        if len(rows):
+            best = rapidfuzz.process.extractOne(ingredient_name, [self.descriptions[row] for row in rows], scorer=scorer)
+            return best[0], best[1], int(rows[best[2]])
+        best = rapidfuzz.process.extractOne(ingredient_name, self.descriptions, scorer=scorer)
+        if best is None: return None
+        return best
+
+    def nutrition_values(self, row: int) -> list[int]:
+        """ Nutrient vector of a USDA row, scaled by 1000 to the integers the ASP program works with. """
+        return [int(x * 1000) for x in self.values[row]]
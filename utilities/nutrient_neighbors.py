@@ -0,0 +1,65 @@
+import numpy as np
+from utilities.nutrient_index import NutrientIndex
+try:
+    from sklearn.neighbors import BallTree # Optional; unfiltered queries over large tables
+except ImportError:
+    BallTree = None
+
+class NutrientNeighbors:
+    def __init__(self, index: NutrientIndex, tree: bool = False):
+        """ k nearest USDA foods in nutrition: the 14 nutrient columns, standardized once (zero mean, unit variance, so
+            that sodium in mg does not drown out fat in g), searched exactly with NumPy.
+            Queries can be restricted per nutrient ("lower in sodium and fat than X") and by any boolean mask of rows.
+            @args:
+                index : NutrientIndex whose values are searched
+                tree : bool, whether to also build a sklearn BallTree for unfiltered queries (when sklearn is installed)
+        """
+        self.columns = index.columns
+        self.values = index.values
+        mean, std = self.values.mean(axis=0), self.values.std(axis=0)
+        self.scale = np.where(std > 0, std, 1.0) # Constant columns do not count
+        self.vectors = np.ascontiguousarray((self.values - mean) / self.scale, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors) # Squared norms, for distances by one product
+        self.tree = BallTree(self.vectors) if tree and BallTree is not None and len(self.vectors) else None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def column(self, nutrient) -> int:
+        """ Column of a nutrient, given by name ("Sodium") or number. """
+        return nutrient if type(nutrient) == int else self.columns.index(nutrient)
+
+    def lower_than(self, row: int, nutrients: list) -> np.ndarray:
+        """ Mask of the rows strictly lower than row in every given nutrient. """
+        mask = np.ones(len(self), dtype=np.bool_)
+        for nutrient in nutrients:
+            column = self.column(nutrient)
+            mask &= self.values[:, column] < self.values[row, column]
+        return mask
+
+    def query(self, row: int, k: int = 8, lower: list = (), mask: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """ The k rows closest to row in nutrition (Euclidean, standardized), row itself excluded.
+            @args:
+                row : int USDA row to find substitutes for
+                k : int number of neighbours
+                lower : list of nutrients (names or columns) the neighbours must be lower in, e.g. ["Sodium", "Sugar"]
+                mask : bool array over the rows, False for rows that must not be returned
+            @return:
+                tuple - (rows, distances) of at most k neighbours, closest first
+        """
+        if not len(lower) and mask is None and self.tree is not None:
+            distances, rows = self.tree.query(self.vectors[row:row + 1], k=min(k + 1, len(self)))
+            keep = rows[0] != row
+            return rows[0][keep][:k], distances[0][keep][:k]
+        allowed = self.lower_than(row, lower) if len(lower) else np.ones(len(self), dtype=np.bool_)
+        if mask is not None: allowed &= mask
+        allowed[row] = False
+        rows = np.flatnonzero(allowed)
+        if not len(rows): return rows, np.empty(0, dtype=np.float32)
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+        distances = np.maximum(self.norms[rows] + self.norms[row] - 2 * (self.vectors[rows] @ self.vectors[row]), 0)
+        if len(rows) > k:
+            nearest = np.argpartition(distances, k)[:k]
+            rows, distances = rows[nearest], distances[nearest]
+        order = np.lexsort((rows, distances)) # Ties in table order
+        return rows[order], np.sqrt(distances[order])
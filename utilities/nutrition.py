@@ -0,0 +1,131 @@
+from models.classes import Recipe
+from utilities.asp import default_factory # Resolvers sharing one pre-grounded nutrition program
+from utilities.nutrition_engine import NutritionEngine # NumPy fast path
+from utilities.units import default_registry # Units and piece weights of config/units.json
+from utilities.density_store import default_store # Densities of the USDA descriptions, with fallbacks
+
+# Aggregates shown by the ASP program and the Recipe.nutritional_values entry each one fills
+TOTALS = {
+    "total_calories": "Calories",
+    "total_protein": "Protein",
+    "total_fat": "TotalFat",
+    "total_carbs": "Carbohydrate",
+    "total_sodium": "Sodium",
+    "total_satfat": "SaturatedFat",
+    "total_chol": "Cholesterol",
+    "total_sugar": "Sugar",
+    "total_calcium": "Calcium",
+    "total_iron": "Iron",
+    "total_potassium": "Potassium",
+    "total_vitamin_c": "VitaminC",
+    "total_vitamin_e": "VitaminE",
+    "total_vitamin_d": "VitaminD",
+}
+
+# Percentages of the daily caloric intake and the Recipe.percentages key each one fills
+PERCENTAGES = {
+    "total_carb_pct": "carb",
+    "total_protein_pct": "protein",
+    "total_fat_pct": "fat",
+    "total_satfat_pct": "satfat",
+    "total_sugar_pct": "sugar",
+}
+
+def resolve_ingredients(recipe: Recipe, matcher) -> None:
+    """ Match every ingredient of the recipe to its USDA row, once.
+        @args:
+            recipe : Recipe whose matches are filled in
+            matcher : NutrientIndex or MatchCache used to match the ingredients
+    """
+    if len(recipe.matches) != len(recipe.list):
+        recipe.matches = [matcher.match(ingredient_info[0]) for ingredient_info in recipe.list]
+
+def read_model(recipe: Recipe, symbols) -> None:
+    """ Store the aggregates of a nutrition model (the shown symbols of clingoResolver.models) in the recipe. """
+    for term in symbols:
+        if term.name in TOTALS:
+            recipe.nutritional_values[TOTALS[term.name]] = term.arguments[0].number
+        elif term.name in PERCENTAGES:
+            recipe.percentages[PERCENTAGES[term.name]] = term.arguments[0].number
+        elif term.name == "total_ingredient":
+            add_ingredient(recipe, term.arguments[0].string, None, [argument.number for argument in term.arguments[1:]])
+        elif term.name == "convert":
+            add_ingredient(recipe, term.arguments[0].string, term.arguments[3].number, None)
+
+def add_ingredient(recipe: Recipe, description: str, grams: int, values: list[int]) -> None:
+    """ Store the grams or nutritional values of a matched ingredient; ingredients matched to the same USDA description
+        (e.g. an ingredient and its substitute) add up, as in the totals. """
+    if grams is not None: recipe.grams[description] = recipe.grams.get(description, 0) + grams
+    if values is not None:
+        previous = recipe.ingredient_nutrition.get(description)
+        recipe.ingredient_nutrition[description] = values if previous is None else [a + b for a, b in zip(previous, values)]
+
+def ingredient_arguments(recipe: Recipe, matcher) -> tuple[list, list, list, list, list]:
+    """ (names, nutrition_values, quantities, metrics, densities) of the matched ingredients of a recipe,
+        as taken by clingoResolver.add_ingredients and the NutritionEngine; units are canonical (see UnitRegistry.resolve). """
+    units, density_store = default_registry(), default_store()
+    names, nutrition_values, quantities, metrics, densities = [], [], [], [], []
+    for ingredient_info, match in zip(recipe.list, recipe.matches):
+        if match is None: continue
+        ingredient_descriptor, score, usda_row = match
+        names.append(ingredient_descriptor)
+        nutrition_values.append(matcher.nutrition_values(usda_row))
+        # Ingredients without a quantity ("pinch of salt") or a known unit still count as present, but add nothing to the totals
+        quantity, unit = units.resolve(ingredient_info[0], ingredient_info[1], ingredient_info[2])
+        quantities.append(quantity)
+        metrics.append(unit)
+        densities.append(density_store.density(ingredient_descriptor))
+    return names, nutrition_values, quantities, metrics, densities
+
+def line_grams(ingredient_info: list, match: tuple) -> int:
+    """ Weight in grams of one matched ingredient line, as the nutrition pass computes it (see ingredient_arguments);
+        None where the line adds nothing to the totals. """
+    units = default_registry()
+    quantity, unit = units.resolve(ingredient_info[0], ingredient_info[1], ingredient_info[2])
+    return units.grams(quantity, unit, default_store().density(match[0]))
+
+def compile_nutrition(recipe: Recipe, matcher, engine: NutritionEngine = None, cross_check: bool = False) -> bool:
+    """ Compile the nutritional data of a recipe from the USDA data, and store it in the recipe for later phases.
+        A clingo.Control() object scales the nutritional values based on quantity and metric to the 100 gram standard,
+        unless a NutritionEngine is given to compute the same values with NumPy.
+        @args:
+            recipe : Recipe to compile the nutritional data of
+            matcher : NutrientIndex or MatchCache used to match the ingredients
+            engine : NutritionEngine for the NumPy fast path (default is clingo)
+            cross_check : bool, with an engine, also solve with clingo and report any disagreement
+        @return:
+            bool - True if the nutrition program was satisfiable, else False.
+    """
+    if recipe.resolved: return True
+    resolve_ingredients(recipe, matcher)
+    arguments = ingredient_arguments(recipe, matcher)
+    if engine is not None:
+        if cross_check:
+            for mismatch in engine.cross_check(*arguments): print(f"Cross-check mismatch for {recipe.dish}: {mismatch}")
+        read_model(recipe, engine.compute(*arguments).models)
+        recipe.resolved = True
+        return True
+
+    nutrition = default_factory().resolver()
+    nutrition.add_ingredients(*arguments) # All facts in one call
+
+    # After all ingredients have been added, we can look to resolve to get aggregate data
+    nutrition.ground() # Ground the recipe's part of the program
+    results, flag = nutrition.resolve()
+    if flag:
+        read_model(recipe, nutrition.models)
+        recipe.resolved = True
+    else:
+        print("UNSAT RESULTS: ", results)
+    return flag
+
+def batch_arguments(recipes: list[Recipe], matcher) -> tuple[list, list, list, list, list, list]:
+    """ (recipe_ids, names, nutrition_values, quantities, metrics, densities) of many recipes as the flat, aligned lists taken by
+        NutritionEngine.compute_batch; recipe i of the list has id i. """
+    recipe_ids, names, nutrition_values, quantities, metrics, densities = [], [], [], [], [], []
+    for i, recipe in enumerate(recipes):
+        resolve_ingredients(recipe, matcher)
+        arguments = ingredient_arguments(recipe, matcher)
+        recipe_ids += [i] * len(arguments[0])
+        for column, values in zip((names, nutrition_values, quantities, metrics, densities), arguments): column += values
+    return recipe_ids, names, nutrition_values, quantities, metrics, densities
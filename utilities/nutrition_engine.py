@@ -0,0 +1,137 @@
+import numpy as np
+from utilities import asp
+from utilities.units import UnitRegistry, default_registry # Unit factors shared with the ASP program
+
+# Recipe.nutritional_values order of the 14 USDA columns, and the ASP aggregate of each column the program sums
+NUTRIENTS = ['Calories', 'Protein', 'TotalFat', 'Carbohydrate', 'Sodium', 'SaturatedFat', 'Cholesterol', 'Sugar',
+             'Calcium', 'Iron', 'Potassium', 'VitaminC', 'VitaminE', 'VitaminD']
+TOTAL_NAMES = ['total_calories', 'total_protein', 'total_fat', 'total_carbs', 'total_sodium', 'total_satfat', 'total_chol', 'total_sugar',
+               'total_calcium', 'total_iron', 'total_potassium', 'total_vitamin_c', 'total_vitamin_e', 'total_vitamin_d']
+# (metric, column, kcal per gram * 100) of each percentage rule
+PERCENTAGE_RULES = [('carb', 3, 400), ('protein', 1, 400), ('fat', 2, 900), ('satfat', 5, 900), ('sugar', 7, 400)]
+
+class NutritionResult:
+    def __init__(self, names: list[str], grams: np.ndarray, ingredient_totals: np.ndarray, totals: np.ndarray,
+                 percentages: dict[str, int], calorie_percentages: dict[str, int]):
+        """ Nutrition of one recipe as computed by NutritionEngine.
+            @args:
+                names : list of the ingredients that count towards the totals (unique with grams)
+                grams : array of the weight of each of those ingredients in grams
+                ingredient_totals : (ingredients x 14) array of their scaled nutritional values
+                totals : array of the 14 scaled recipe totals, in NUTRIENTS order
+                percentages : dict of total_<metric>_pct, share of the daily caloric intake
+                calorie_percentages : dict of <metric>_pct, share of the recipe's calories (empty without calories)
+        """
+        self.names = names
+        self.grams = grams
+        self.ingredient_totals = ingredient_totals
+        self.totals = totals
+        self.percentages = percentages
+        self.calorie_percentages = calorie_percentages
+
+    @property
+    def models(self) -> list:
+        """ The result as the shown symbols of a clingo model (see clingoResolver.models), for nutrition.read_model().
+            Input facts (ingredient/15) are not repeated; convert/5 carries the computed grams only.
+        """
+        import clingo
+        N, S, F = clingo.Number, clingo.String, clingo.Function
+        symbols = []
+        for name, grams, values in zip(self.names, self.grams, self.ingredient_totals):
+            symbols.append(F("convert", [S(name), N(0), F("unit"), N(int(grams)), F("gram")]))
+            symbols.append(F("total_ingredient", [S(name), *(N(int(v)) for v in values)]))
+        for name, value in zip(TOTAL_NAMES, self.totals):
+            symbols.append(F(name, [N(int(value))]))
+        for metric, value in self.calorie_percentages.items():
+            symbols.append(F(f"{metric}_pct", [N(value)]))
+        for metric, value in self.percentages.items():
+            symbols.append(F(f"total_{metric}_pct", [N(value)]))
+        return symbols
+
+class NutritionEngine:
+    def __init__(self, units: UnitRegistry = None, daily_calories: int = 2000):
+        """ Vectorized equivalent of the nutrition rules of the ASP program: unit conversion, density scaling and sums
+            are linear, so they are computed as integer matrix operations with the same truncating divisions.
+            @args:
+                units : UnitRegistry of the unit factors (default is config/units.json, as for the ASP program)
+                daily_calories : int daily caloric intake the total_*_pct percentages refer to
+        """
+        self.units = units or default_registry()
+        self.daily_calories = daily_calories
+
+    def grams(self, names: list[str], quantities: list[int], metrics: list[str], densities: list[int] = None) -> np.ndarray:
+        """ convert/5 for each ingredient: grams as int64, or -1 where the ASP program derives nothing
+            (no quantity, an unknown unit, or a volume without a density). """
+        grams = np.full(len(names), -1, dtype=np.int64)
+        densities = [None] * len(names) if densities is None else densities
+        for i, (quantity, metric, density) in enumerate(zip(quantities, metrics, densities)):
+            weight = self.units.grams(quantity, metric, density)
+            if weight is not None: grams[i] = weight
+        return grams
+
+    def compute_batch(self, recipe_ids, names: list[str], nutrition_values, quantities: list[int], metrics: list[str],
+                      densities: list[int] = None, recipes: int = None) -> dict:
+        """ Nutrition of many recipes in one pass. Ingredients of all recipes are given as flat, aligned arrays.
+            @args:
+                recipe_ids : array of the recipe (0 .. recipes-1) each ingredient belongs to
+                names, nutrition_values, quantities, metrics, densities : as for clingoResolver.add_ingredients
+                recipes : int number of recipes (default is max(recipe_ids) + 1)
+            @return:
+                dict of arrays:
+                    'totals' (recipes x 14), 'percentages' (recipes x 5, same order as PERCENTAGE_RULES),
+                    'calorie_percentages' (recipes x 5, -1 where the recipe has no calories),
+                    'grams' and 'ingredient_totals' per ingredient (-1 grams and zero rows where nothing counts)
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        if recipes is None: recipes = int(recipe_ids.max()) + 1 if len(recipe_ids) else 0
+        values = np.asarray(nutrition_values, dtype=np.int64).reshape(len(names), len(NUTRIENTS))
+        grams = self.grams(names, quantities, metrics, densities)
+
+        # ASP facts are a set: the same ingredient at the same weight in one recipe only counts once
+        _, name_ids = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+        keys = np.stack([recipe_ids, name_ids.reshape(-1), grams], axis=1)
+        _, first = np.unique(keys[grams >= 0], axis=0, return_index=True)
+        counted_rows = np.flatnonzero(grams >= 0)[first]
+        counted = np.zeros(len(names), dtype=np.bool_)
+        counted[counted_rows] = True
+
+        ingredient_totals = np.zeros_like(values)
+        ingredient_totals[counted_rows] = values[counted_rows] * grams[counted_rows, None] // 100000
+        totals = np.zeros((recipes, len(NUTRIENTS)), dtype=np.int64)
+        np.add.at(totals, recipe_ids[counted_rows], ingredient_totals[counted_rows])
+
+        percentages = np.stack([totals[:, column] * factor // self.daily_calories for _, column, factor in PERCENTAGE_RULES], axis=1)
+        # Division by zero calories is undefined in ASP, so those rules derive nothing
+        calories = totals[:, 0]
+        divisor = np.where(calories != 0, calories, 1)
+        calorie_percentages = np.stack([np.where(calories != 0, totals[:, column] * factor // divisor, -1)
+                                        for _, column, factor in PERCENTAGE_RULES], axis=1)
+        return {"totals": totals, "percentages": percentages, "calorie_percentages": calorie_percentages,
+                "grams": np.where(counted, grams, -1), "ingredient_totals": ingredient_totals}
+
+    def compute(self, names: list[str], nutrition_values, quantities: list[int], metrics: list[str], densities: list[int] = None) -> NutritionResult:
+        """ Nutrition of one recipe; takes the same arguments as clingoResolver.add_ingredients. """
+        batch = self.compute_batch(np.zeros(len(names), dtype=np.int64), names, nutrition_values, quantities, metrics, densities, recipes=1)
+        rows = np.flatnonzero(batch["grams"] >= 0)
+        totals = batch["totals"][0]
+        percentages = {metric: int(v) for (metric, _, _), v in zip(PERCENTAGE_RULES, batch["percentages"][0])}
+        calorie_percentages = {metric: int(v) for (metric, _, _), v in zip(PERCENTAGE_RULES, batch["calorie_percentages"][0]) if totals[0] != 0}
+        return NutritionResult([names[i] for i in rows], batch["grams"][rows], batch["ingredient_totals"][rows], totals, percentages, calorie_percentages)
+
+    def cross_check(self, names: list[str], nutrition_values, quantities: list[int], metrics: list[str], densities: list[int] = None) -> list[str]:
+        """ Compute one recipe with both this engine and clingo and list the aggregates on which they disagree.
+            @return:
+                list of str - One line per mismatching aggregate; empty when both agree.
+        """
+        result = self.compute(names, nutrition_values, quantities, metrics, densities)
+        resolver = asp.default_factory().resolver()
+        resolver.add_ingredients(names, nutrition_values, quantities, metrics, densities)
+        resolver.ground()
+        results, flag = resolver.resolve()
+        if not flag: return ["clingo: unsatisfiable"]
+        aggregates = set(TOTAL_NAMES) | {f"{metric}_pct" for metric, _, _ in PERCENTAGE_RULES} | {f"total_{metric}_pct" for metric, _, _ in PERCENTAGE_RULES}
+        def collect(symbols):
+            return {symbol.name: symbol.arguments[0].number for symbol in symbols if symbol.name in aggregates}
+        expected, actual = collect(resolver.models), collect(result.models)
+        return [f"{name}: clingo={expected.get(name)} numpy={actual.get(name)}"
+                for name in sorted(aggregates) if expected.get(name) != actual.get(name)]
@@ -0,0 +1,136 @@
+import os
+import json
+import numpy as np
+from models.classes import Recipe
+from utilities.dataset_cache import source_signature
+from utilities.units import units_filepath
+from utilities.density_store import default_store
+from utilities.nutrition import TOTALS, batch_arguments # Same matching and flattening as the nutrition pass
+from utilities.nutrition_engine import NutritionEngine, NUTRIENTS, TOTAL_NAMES, PERCENTAGE_RULES
+
+TABLE_VERSION = 2
+TABLE_DIR = "nutrition"
+# Arrays of the table; one row per dataset row
+COLUMNS = {
+    "totals": len(NUTRIENTS), # The 14 scaled nutrient totals, in NUTRIENTS order
+    "percentages": len(PERCENTAGE_RULES), # total_<metric>_pct of the daily caloric intake, in PERCENTAGE_RULES order
+    "calorie_percentages": len(PERCENTAGE_RULES), # <metric>_pct of the recipe's calories, -1 without calories
+}
+
+def table_dir(resources) -> str:
+    return os.path.join(resources.recipe_data.cache_dir, TABLE_DIR)
+
+def table_source(resources) -> dict:
+    """ Everything the table is computed from; a change to any of it makes the table stale. """
+    return {"version": TABLE_VERSION, **resources.recipe_data.meta["source"], "usda": resources.nutrient_index.source,
+            "densities": [source_signature(path) for path in default_store().sources], "units": source_signature(units_filepath)}
+
+def chunk_path(directory: str, start: int) -> str:
+    return os.path.join(directory, f"chunk_{start:09d}.npz")
+
+def compute_chunk(resources, rows: range) -> dict[str, np.ndarray]:
+    """ Nutrition of a range of dataset rows, in one NutritionEngine pass. """
+    recipes = [resources.ingredient_store.recipe(row, "") for row in rows]
+    batch = (resources.engine or NutritionEngine()).compute_batch(*batch_arguments(recipes, resources.match_cache), recipes=len(recipes))
+    return {column: batch[column] for column in COLUMNS}
+
+def write_chunk(resources, task: tuple[str, int, int]) -> int:
+    """ Compute and save one chunk; the file only appears once complete, so an interrupted build resumes cleanly. """
+    directory, start, end = task
+    arrays = compute_chunk(resources, range(start, end))
+    partial = os.path.join(directory, f"partial_{start:09d}.npz")
+    np.savez(partial, **arrays)
+    os.replace(partial, chunk_path(directory, start))
+    resources.match_cache.flush()
+    return end - start
+
+def build(resources, chunk_size: int = 10000, workers: int = None) -> 'NutritionTable':
+    """ Offline pipeline stage: compute the nutrition of every recipe of the dataset into a table next to its cache.
+        The dataset is split into chunks of rows that are computed independently (in parallel with workers) and saved
+        as they complete; chunks already on disk are skipped, so an interrupted build picks up where it stopped.
+        The chunks are finally joined into one memory-mapped .npy file per column.
+        @args:
+            resources : Resources of the dataset
+            chunk_size : int number of rows per chunk
+            workers : int number of worker processes (default is this process only)
+        @return:
+            NutritionTable - The complete table.
+    """
+    directory = table_dir(resources)
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "meta.json")
+    meta = {"source": table_source(resources), "chunk_size": chunk_size, "rows": len(resources.recipe_data), "complete": False}
+    if os.path.isfile(meta_path):
+        with open(meta_path, 'r') as file:
+            previous = json.load(file)
+        if {k: v for k, v in previous.items() if k != "complete"} != {k: v for k, v in meta.items() if k != "complete"}:
+            for name in os.listdir(directory): os.remove(os.path.join(directory, name)) # Stale chunks
+    with open(meta_path, 'w') as file:
+        json.dump(meta, file)
+
+    rows = len(resources.recipe_data)
+    tasks = [(directory, start, min(start + chunk_size, rows)) for start in range(0, rows, chunk_size)
+             if not os.path.isfile(chunk_path(directory, start))]
+    print(f"Computing nutrition of {rows} recipes: {len(tasks)} of {-(-rows // chunk_size)} chunks left...")
+    if workers is not None and workers > 1 and len(tasks) > 1:
+        from utilities.parallel import RecipePool
+        pool = RecipePool(resources, workers)
+        done = pool.map(write_chunk, tasks)
+    else:
+        pool = None
+        done = (write_chunk(resources, task) for task in tasks)
+    for i, count in enumerate(done, start=1):
+        print(f"  chunk {i}/{len(tasks)} ({count} recipes)")
+    if pool is not None: pool.close()
+
+    for column, width in COLUMNS.items():
+        table = np.lib.format.open_memmap(os.path.join(directory, f"{column}.npy"), mode='w+', dtype=np.int64, shape=(rows, width))
+        for start in range(0, rows, chunk_size):
+            with np.load(chunk_path(directory, start)) as chunk:
+                table[start:start + len(chunk[column])] = chunk[column]
+        table.flush()
+        del table
+    meta["complete"] = True
+    with open(meta_path, 'w') as file:
+        json.dump(meta, file)
+    return NutritionTable(directory)
+
+class NutritionTable:
+    def __init__(self, directory: str):
+        """ Precomputed nutrition of every recipe of the dataset (see build), memory-mapped. Row r of each array
+            belongs to dataset row r, so constraint checks and rankings over the dataset are array lookups.
+            @args:
+                directory : str directory written by build()
+        """
+        with open(os.path.join(directory, "meta.json"), 'r') as file:
+            self.meta = json.load(file)
+        self.totals = np.load(os.path.join(directory, "totals.npy"), mmap_mode='r')
+        self.percentages = np.load(os.path.join(directory, "percentages.npy"), mmap_mode='r')
+        self.calorie_percentages = np.load(os.path.join(directory, "calorie_percentages.npy"), mmap_mode='r')
+
+    @classmethod
+    def open(cls, resources) -> 'NutritionTable':
+        """ The table built for resources, or None if it was never built, is incomplete or stale. """
+        meta_path = os.path.join(table_dir(resources), "meta.json")
+        if not os.path.isfile(meta_path): return None
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+        if not meta.get("complete") or meta.get("source") != table_source(resources): return None
+        return cls(table_dir(resources))
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    def column(self, metric: str) -> np.ndarray:
+        """ One column over the whole dataset: a nutrient ("Sodium") or a percentage of the daily intake ("fat"). """
+        if metric in NUTRIENTS: return self.totals[:, NUTRIENTS.index(metric)]
+        return self.percentages[:, [rule[0] for rule in PERCENTAGE_RULES].index(metric)]
+
+    def fill(self, recipe: Recipe, row: int) -> None:
+        """ Store the precomputed nutrition of a dataset row in its Recipe, as compile_nutrition would.
+            Every total is filled in; the per-ingredient breakdown is not kept. """
+        for name in TOTAL_NAMES:
+            recipe.nutritional_values[TOTALS[name]] = int(self.totals[row, NUTRIENTS.index(TOTALS[name])])
+        for (metric, _, _), value in zip(PERCENTAGE_RULES, self.percentages[row]):
+            recipe.percentages[metric] = int(value)
+        recipe.resolved = True
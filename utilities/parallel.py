@@ -0,0 +1,94 @@
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
+from models.classes import Recipe
+from utilities import asp
+from utilities import constraint_compiler
+from utilities import pipeline
+
+# Resources of the worker processes. Set in the parent before the pool starts so that forked workers inherit them
+# (copy-on-write); workers started with spawn load their own from the same memory-mapped caches instead.
+_resources : pipeline.Resources = None
+
+def _initialize(options: dict = None) -> None:
+    global _resources
+    if options is not None: _resources = pipeline.Resources(**options)
+    # Never share a clingo.Control with the parent process
+    asp._default_factory = None
+    constraint_compiler._default_compiler = None
+    _resources.constraints.ctl = None
+
+def _evaluate_variant(task: tuple[str, int, dict]) -> tuple[Recipe, int]:
+    dish, row, specified_constraints = task
+    recipe = _resources.ingredient_store.recipe(row, dish)
+    return recipe, pipeline.evaluate_recipe(_resources, recipe, specified_constraints)
+
+def _call(task: tuple) -> object:
+    function, argument = task
+    return function(_resources, argument)
+
+def _ready() -> None:
+    pass
+
+def _answer(task: tuple[int, str]) -> dict:
+    from utilities.batch import answer_line
+    return answer_line(_resources, *task)
+
+class RecipePool:
+    def __init__(self, resources: pipeline.Resources, workers: int = None):
+        """ Process pool spreading recipe variations, or whole batch queries, over CPU cores; matching (rapidfuzz)
+            and solving (clingo) are CPU-bound and every variation is independent.
+            Results always come back in submission order, so the first safe recipe does not depend on scheduling.
+            @args:
+                resources : Resources of the session, shared read-only with the workers
+                workers : int number of worker processes (default is the number of CPUs)
+        """
+        global _resources
+        _resources = resources
+        if "fork" in mp.get_all_start_methods():
+            context, initargs = mp.get_context("fork"), (None,)
+        else:
+            context, initargs = mp.get_context("spawn"), (resources.options,)
+        resources.match_cache.flush() # Workers see everything matched so far
+        self.workers = workers or mp.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_initialize, initargs=initargs)
+
+    def start(self) -> None:
+        """ Start the worker processes now rather than on the first task, e.g. before opening sockets that forked
+            workers would otherwise inherit. """
+        for future in [self.executor.submit(_ready) for _ in range(self.workers)]: future.result()
+
+    def stream(self, function, tasks: Iterable, window: int = None) -> Iterator:
+        """ function(task) for every task, in the workers, yielded in task order. At most window tasks (default is two
+            per worker) are in flight, so tasks are only taken from the iterable as results are consumed; closing the
+            generator early cancels the tasks still queued. """
+        window = window or self.workers * 2
+        tasks, pending = iter(tasks), deque()
+        try:
+            for task in tasks:
+                pending.append(self.executor.submit(function, task))
+                if len(pending) >= window: yield pending.popleft().result()
+            while len(pending): yield pending.popleft().result()
+        finally:
+            for future in pending: future.cancel()
+
+    def evaluate(self, dish: str, rows: list[int], specified_constraints: dict) -> Iterator[tuple[Recipe, int]]:
+        """ Parallel pipeline.stream_evaluations: (Recipe, flag) pairs in row order, evaluated a window ahead of the consumer. """
+        return self.stream(_evaluate_variant, ((dish, row, specified_constraints) for row in rows))
+
+    def answer(self, lines: Iterable[tuple[int, str]]) -> Iterator[dict]:
+        """ Answer (line number, line) queries of a batch in the workers, see batch.answer_line; results are yielded in line order. """
+        return self.stream(_answer, lines)
+
+    def submit(self, function, argument) -> Future:
+        """ function(resources, argument) in a worker; function must be defined at module level. """
+        return self.executor.submit(_call, (function, argument))
+
+    def map(self, function, arguments: list) -> list:
+        """ function(resources, argument) for every argument, in the workers; function must be defined at module level.
+            Results are yielded in the order of the arguments. """
+        return self.executor.map(_call, [(function, argument) for argument in arguments])
+
+    def close(self) -> None:
+        self.executor.shutdown()
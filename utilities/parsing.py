@@ -0,0 +1,45 @@
+import re   # For regex operations
+from typing import Union # For type hinting
+from fractions import Fraction # Used to handle string representation of fractions into numerical values
+
+# Used to parse the quantity and unit of measurement from the ingredient string
+pattern = r'^\s*(?P<quantity>(?:\d+\s\d+/\d+|\d+/\d+|\d+(?:\.\d+)?))\s*(?P<unit>oz\.?|lb\.?|g|kg|ml|l|cups?|c\.?|tbsp\.?|tablespoons?|tsp\.?|teaspoons?|pkg\.?|package|can|box|bag|envelope|jar|container|stick|bottle|slice|block)?\s+(?P<ingredient>.+)$'
+ingredient_regex = re.compile(pattern, re.IGNORECASE)
+
+def parse_quantity(s: str) -> Union[float,None]:
+    """
+        Parse a string representing a quantity and convert it to a float.
+        Handles mixed numbers, simple fractions, and decimals.
+        @args:
+            s: str - The string to parse.
+        @return:
+            float - The parsed quantity as a float.
+            None - If the string cannot be parsed.
+    """
+    s = s.strip().replace(',', '')  # Remove commas (e.g., "1,000" -> "1000")
+    try:
+        # Mixed number: e.g., "1 1/2"
+        if ' ' in s and '/' in s:
+            whole, frac = s.split()
+            return float(whole) + float(Fraction(frac))
+        # Simple fraction: e.g., "3/4"
+        elif '/' in s:
+            return float(Fraction(s))
+        # Decimal or integer: e.g., "1000", "0.75"
+        else:
+            return float(s)
+    except (ValueError, ZeroDivisionError):
+        return None  # Graceful fallback
+
+def parse_ingredient(line: str) -> tuple[str, Union[float,None], str]:
+    """
+        Split one line of a recipe's ingredient list into (ingredient, quantity, metric).
+        Lines without a leading quantity are kept whole, with no quantity or metric.
+        @args:
+            line: str - The ingredient line, e.g. "1 1/2 c. sugar".
+        @return:
+            tuple - (ingredient, quantity, metric); metric is '' when the quantity has no unit.
+    """
+    match = ingredient_regex.match(line)
+    if match is None: return line, None, None
+    return match.group('ingredient'), parse_quantity(match.group('quantity')), match.group('unit') or ''
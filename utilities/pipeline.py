@@ -0,0 +1,241 @@
+import os
+import json
+from typing import Iterable, Iterator
+from models.classes import Recipe
+from error_classes.errors import QueryError
+from utilities import test_constraints as tc # Importing the test_constraints module for constraint testing
+from utilities.nutrition import compile_nutrition # Nutrition pass; results are stored on each Recipe
+from utilities.nutrition_engine import NutritionEngine # NumPy fast path for the nutrition pass
+from utilities.dataset_cache import RecipeDataset # Memory-mapped columnar cache of the recipe dataset
+from utilities.ingredient_store import IngredientStore # Ingredient lines of every recipe, parsed ahead of time
+from utilities.title_index import TitleIndex # Exact and trigram-narrowed fuzzy lookup of recipe titles
+from utilities.nutrient_index import NutrientIndex # Token-indexed lookup of USDA descriptions and nutrients
+from utilities.nutrient_neighbors import NutrientNeighbors # Nearest USDA foods in nutrition, for substitutes
+from utilities.match_cache import MatchCache # Memoized ingredient -> USDA matches, persisted across runs
+from utilities.allergen_index import AllergenIndex, AllergenMatcher # Allergen masks of every ingredient and recipe
+from utilities.nutrition_table import NutritionTable # Precomputed nutrition of every recipe, when built
+from utilities.constraint_compiler import ConstraintCompiler # Bounds of the conditions, compiled
+from utilities.substitution import Substituter # Ingredient substitutions for recipes that violate their constraints
+from utilities.result_cache import ResultCache, RESULTS_FILE, file_hash # Answers of earlier queries, content-addressed
+from utilities.dataset_cache import source_signature
+from utilities.density_store import default_store
+from utilities.allergen_index import allergens_filepath
+from utilities.units import units_filepath
+
+recipes_filepath = os.path.join("data", "full_dataset.csv")
+usda_filepath = os.path.join("data", "USDA.csv")
+constraints_filepath = os.path.join("config", "constraints.json")
+
+class Resources:
+    def __init__(self, recipes_path: str = recipes_filepath, usda_path: str = usda_filepath,
+                 constraints_path: str = constraints_filepath, engine: str = "clingo", cross_check: bool = False):
+        """ Datasets and indexes of a session, loaded once and shared by every query.
+            @args:
+                recipes_path : str path to the RecipeNLG full_dataset.csv
+                usda_path : str path to USDA.csv
+                constraints_path : str path to the constraints configuration
+                engine : str "clingo" or "numpy", the engine of the nutrition pass
+                cross_check : bool, with the numpy engine, also solve every recipe with clingo and report any disagreement
+            @raise:
+                ValueError - On cross_check with the clingo engine.
+        """
+        if cross_check and engine != "numpy": raise ValueError("Cross-checking needs the numpy engine")
+        # Arguments, for worker processes that load their own Resources (see parallel.RecipePool)
+        self.options = {"recipes_path": recipes_path, "usda_path": usda_path, "constraints_path": constraints_path, "engine": engine,
+                        "cross_check": cross_check}
+        # Open (or build, on first run/after the .csv changes) the columnar cache of the recipe dataset
+        self.recipe_data = RecipeDataset.open(recipes_path)
+        self.title_index = TitleIndex.open(self.recipe_data)
+        self.ingredient_store = IngredientStore.open(self.recipe_data)
+        self.nutrient_index = NutrientIndex.open(usda_path) # USDA descriptions and nutrients, indexed once
+        self.allergen_index = AllergenIndex.open(self.recipe_data, self.ingredient_store, self.nutrient_index)
+        self.ingredient_store.allergens = self.allergen_index
+        self.match_cache = MatchCache(self.nutrient_index, path=os.path.join(self.recipe_data.cache_dir, "matches.sqlite"))
+        self.engine = NutritionEngine() if engine == "numpy" else None
+        self.cross_check = cross_check
+        self.nutrition_table = NutritionTable.open(self) # None until built with --precompute
+        with open(constraints_path, 'r') as file:
+            self.constraint_data = json.load(file)
+        self.constraints = ConstraintCompiler(self.constraint_data) # Bounds compiled once into solver parts and masks
+        self.nutrient_neighbors = NutrientNeighbors(self.nutrient_index)
+        self.substituter = Substituter(self.nutrient_index, self.match_cache, self.constraints, self.allergen_index.matcher,
+                                       self.engine, neighbors=self.nutrient_neighbors)
+
+        self.result_cache = ResultCache(os.path.join(self.recipe_data.cache_dir, RESULTS_FILE), result_source(self))
+
+    def close(self) -> None:
+        self.match_cache.close()
+        self.result_cache.close()
+
+def result_source(resources: Resources) -> dict:
+    """ Everything the answer to a query depends on besides the query: the datasets, the configuration and the density
+        files. Part of every result cache key, so results computed from other data are never served. """
+    return {**resources.recipe_data.meta["source"], "usda": resources.nutrient_index.source,
+            "config": {os.path.basename(path): file_hash(path) for path in (resources.options["constraints_path"], allergens_filepath, units_filepath)},
+            "densities": [source_signature(path) for path in default_store().sources]}
+
+def find_dish(resources: Resources, dish: str, min_score: float = 80) -> tuple[str, list[int]]:
+    """ Rows of a dish: exact title matches, else those of the closest title.
+        @args:
+            min_score : float fuzzy score (0-100) the closest title must exceed to stand for the dish
+        @return:
+            tuple - (title of the dish, list of dataset rows)
+        @raise:
+            QueryError - If no title resembles the dish.
+    """
+    rows = resources.title_index.lookup(dish)
+    if not len(rows):
+        matches = resources.title_index.search(dish, limit=1)
+        if not len(matches) or matches[0][1] <= min_score: raise QueryError()
+        dish = matches[0][0]
+        rows = resources.title_index.lookup(dish)
+    return dish, rows
+
+def stream_recipes(resources: Resources, dish: str, rows: Iterable[int]) -> Iterator[Recipe]:
+    """ The variations of a dish, one at a time as the consumer asks for them, each built straight from its pre-parsed
+        (ingredient, quantity, metric) records. """
+    for row in rows:
+        yield resources.ingredient_store.recipe(row, dish)
+
+def compile_recipe_book(resources: Resources, recipe_book: list[Recipe]) -> None:
+    """ Compile the nutritional data of every recipe; stored on each Recipe and reused by the constraint phase.
+        Dataset recipes are looked up in the precomputed nutrition table when there is one. """
+    for recipe in recipe_book:
+        if resources.nutrition_table is not None and recipe.row is not None and not recipe.resolved:
+            resources.nutrition_table.fill(recipe, recipe.row)
+            continue
+        compile_nutrition(recipe, resources.match_cache, engine=resources.engine, cross_check=resources.cross_check)
+
+def compile_breakdown(resources: Resources, recipe: Recipe) -> None:
+    """ compile_recipe_book for a recipe whose per-ingredient nutrition is reported: the nutrition table only keeps
+        the totals, so a recipe filled from it is compiled again, with the same totals and its breakdown. """
+    if recipe.resolved and len(recipe.ingredient_nutrition): return
+    recipe.reset_nutrition()
+    compile_nutrition(recipe, resources.match_cache, engine=resources.engine, cross_check=resources.cross_check)
+
+def validate_constraints(resources: Resources, specified_constraints: dict) -> dict:
+    """ Check specified constraints against the configuration, e.g. {"Diabetes": "Type 2", "Allergen": ["Eggs"], "Obesity": []}.
+        @return:
+            dict - The constraints with every variant given as a list ({"Allergen": "Eggs"} -> {"Allergen": ["Eggs"]}),
+                   the form every later stage takes.
+        @raise:
+            ValueError - On constraints that are not an object, or an unknown constraint or variant.
+    """
+    if type(specified_constraints) != dict: raise ValueError(f"Constraints must be an object, not {type(specified_constraints).__name__}")
+    configured = {x["name"]: x.get("variants", []) for x in resources.constraint_data["constraints"]}
+    validated = {}
+    for constraint, variants in specified_constraints.items():
+        if constraint not in configured: raise ValueError(f"Unknown constraint: {constraint}")
+        if type(variants) not in (str, list): raise ValueError(f"Variants of {constraint} must be a string or a list")
+        validated[constraint] = [variants] if type(variants) == str else list(variants)
+        for variant in validated[constraint]:
+            if variant not in configured[constraint]: raise ValueError(f"Unknown {constraint} variant: {variant}")
+    return validated
+
+def screen_allergens(recipe: Recipe, specified_constraints: dict, compiler: ConstraintCompiler = None, matcher: AllergenMatcher = None) -> int:
+    """ First stage of check_constraints: ingredient names only, so it can run before any nutrition is compiled. """
+    if 'Allergen' not in specified_constraints: return 0
+    return tc.test_allergens(recipe, specified_constraints['Allergen'], matcher)
+
+def solve_constraints(recipe: Recipe, specified_constraints: dict, compiler: ConstraintCompiler = None, matcher: AllergenMatcher = None) -> int:
+    """ Last stage of check_constraints: the compiled solver parts of every condition, in a single solve. A recipe
+        whose nutrition was not resolved has no percentages and violates every condition with bounds. """
+    return tc.test_conditions(recipe, specified_constraints, compiler)
+
+# Stages of check_constraints, cheapest first
+CONSTRAINT_STAGES = [screen_allergens, solve_constraints]
+
+def check_constraints(recipe: Recipe, specified_constraints: dict, compiler: ConstraintCompiler = None, matcher: AllergenMatcher = None) -> int:
+    """ Apply the specified constraints to a recipe whose nutrition has been compiled. The checks run from cheapest to
+        most expensive (see CONSTRAINT_STAGES) and stop at the first violation.
+        @args:
+            compiler : ConstraintCompiler of the session (default is config/constraints.json)
+            matcher : AllergenMatcher of the session (default is config/allergens.json)
+        @return:
+            0 if the recipe is compatible, else 1.
+    """
+    for stage in CONSTRAINT_STAGES:
+        flag = stage(recipe, specified_constraints, compiler, matcher)
+        if flag: return flag
+    return 0
+
+def evaluate_recipe(resources: Resources, recipe: Recipe, specified_constraints: dict) -> int:
+    """ check_constraints for a recipe that may not be compiled yet; recipes rejected on their ingredient names
+        alone are never matched against the USDA data nor solved. """
+    flag = screen_allergens(recipe, specified_constraints, matcher=resources.allergen_index.matcher)
+    if flag: return flag
+    compile_recipe_book(resources, [recipe])
+    return check_constraints(recipe, specified_constraints, resources.constraints, resources.allergen_index.matcher)
+
+def stream_evaluations(resources: Resources, dish: str, rows: Iterable[int], specified_constraints: dict, pool=None) -> Iterator[tuple[Recipe, int]]:
+    """ Build, compile and check the variations of a dish lazily, in row order: each (Recipe, flag) is yielded as soon
+        as it is known, and nothing past what the consumer takes is kept or computed (a pool works a bounded window ahead).
+        @args:
+            pool : parallel.RecipePool to evaluate the variations in (default is in this process)
+    """
+    if pool is not None:
+        yield from pool.evaluate(dish, rows, specified_constraints)
+        return
+    for recipe in stream_recipes(resources, dish, rows):
+        yield recipe, evaluate_recipe(resources, recipe, specified_constraints)
+
+def substitute(resources: Resources, recipe: Recipe, specified_constraints: dict) -> Recipe:
+    """ Substitute the offending ingredients of a recipe that violates its constraints (see substitution.Substituter).
+        @return:
+            Recipe - The refactored copy, checked again with check_constraints, or None if no substitution makes it safe.
+    """
+    refactored = resources.substituter.refactor(recipe, specified_constraints)
+    if refactored is None or check_constraints(refactored, specified_constraints, resources.constraints, resources.allergen_index.matcher): return None
+    return refactored
+
+def violations(resources: Resources, recipe: Recipe, specified_constraints: dict) -> list[str]:
+    """ Names of the specified constraints a compiled recipe violates: "Allergen <name>" per allergen it contains, and
+        "<condition> <variant>" per condition whose bounds it breaks (see ConstraintCompiler.violations). """
+    allergens = specified_constraints.get("Allergen", [])
+    violated = [f"Allergen {allergen}" for allergen in ([allergens] if type(allergens) == str else allergens)
+                if screen_allergens(recipe, {"Allergen": [allergen]}, matcher=resources.allergen_index.matcher)]
+    violated += [f"{condition.name} {condition.variant or ''}".strip() for condition in resources.constraints.violations(recipe, specified_constraints)]
+    return violated
+
+def refactor(resources: Resources, dish: str, specified_constraints: dict, pool=None, substitute_ingredients: bool = False) -> dict:
+    """ Answer one query without any user interaction: find the dish, compile its variations and apply the constraints.
+        Answers are kept in the result cache of the session, so a repeated query is neither matched nor solved again.
+        @args:
+            resources : Resources of the session
+            dish : str name of the dish
+            specified_constraints : dict of constraint -> variant(s), shaped like config/constraints.json
+            pool : parallel.RecipePool to evaluate the variations in (default is in this process)
+            substitute_ingredients : bool, whether to substitute the ingredients of the first variation when none is safe
+        @return:
+            dict - status ("safe", "refactored", "failed" or "not_found"), the matched dish, the number of variations
+                   and the first safe recipe (or the refactored first variation, or, on "failed", the first violating one
+                   with the constraints it violates).
+    """
+    specified_constraints = validate_constraints(resources, specified_constraints)
+    try:
+        dish, rows = find_dish(resources, dish)
+    except QueryError:
+        return {"status": "not_found", "dish": None, "variants": 0, "recipe": None}
+    key = resources.result_cache.key(rows, specified_constraints, substitute_ingredients)
+    result = resources.result_cache.get(key)
+    if result is None:
+        result = refactor_rows(resources, dish, rows, specified_constraints, pool, substitute_ingredients)
+        resources.result_cache.put(key, result)
+    return result
+
+def refactor_rows(resources: Resources, dish: str, rows: list[int], specified_constraints: dict, pool=None, substitute_ingredients: bool = False) -> dict:
+    """ refactor, once the rows of the dish are found. """
+    # Only the first variation (reported when none is safe) and the current one are held at any time
+    violating = None
+    evaluations = stream_evaluations(resources, dish, rows, specified_constraints, pool=pool)
+    for recipe, flag in evaluations:
+        if flag == 0:
+            evaluations.close()
+            compile_breakdown(resources, recipe)
+            return {"status": "safe", "dish": dish, "variants": len(rows), "recipe": recipe.to_dict()}
+        if violating is None: violating = recipe
+    compile_breakdown(resources, violating) # It may have been rejected before its nutrition was compiled
+    refactored = substitute(resources, violating, specified_constraints) if substitute_ingredients else None
+    if refactored is not None: return {"status": "refactored", "dish": dish, "variants": len(rows), "recipe": refactored.to_dict()}
+    return {"status": "failed", "dish": dish, "variants": len(rows), "recipe": violating.to_dict(),
+            "violations": violations(resources, violating, specified_constraints)}
@@ -0,0 +1,39 @@
+import numpy as np
+from utilities.nutrition_table import compute_chunk # Nutrition of rows missing from a precomputed table
+from utilities.pipeline import validate_constraints # Same checks and variant lists as the query pipeline
+
+def allergen_mask(resources, rows: np.ndarray, allergens: list[str]) -> np.ndarray:
+    """ Which of the rows contain none of the allergens; one AND over the precomputed recipe masks.
+        @raise:
+            ValueError - On an allergen the taxonomy does not know.
+    """
+    index = resources.allergen_index
+    unknown = [allergen for allergen in allergens if not index.bits([allergen])]
+    if len(unknown): raise ValueError(f"Allergens missing from the taxonomy: {', '.join(unknown)}")
+    return (index.recipe_masks[rows] & np.uint32(index.bits(allergens))) == 0
+
+def filter_recipes(resources, pattern: str, specified_constraints: dict, regex: bool = False) -> np.ndarray:
+    """ All recipes whose title matches a pattern and that satisfy the specified constraints, found with boolean masks
+        over the whole dataset instead of one solver call per recipe, e.g.
+        filter_recipes(resources, "soup", {"Diabetes": "Type 2", "Allergen": ["Eggs"]}).
+        Percentages come from the precomputed nutrition table; without one, they are computed for the matching titles.
+        @args:
+            resources : Resources of the session
+            pattern : str substring of the titles (case insensitive), or a regular expression with regex
+            specified_constraints : dict of constraint -> variant(s), shaped like config/constraints.json
+            regex : bool, whether pattern is a regular expression
+        @return:
+            array of the dataset rows of the matching recipes, in dataset order
+        @raise:
+            ValueError - On an unknown constraint or variant (see pipeline.validate_constraints).
+    """
+    specified_constraints = validate_constraints(resources, specified_constraints)
+    rows = resources.title_index.matching(pattern, regex=regex)
+    if 'Allergen' in specified_constraints:
+        rows = rows[allergen_mask(resources, rows, specified_constraints['Allergen'])]
+    if not len(rows): return rows
+    if resources.nutrition_table is not None:
+        percentages = resources.nutrition_table.percentages[rows]
+    else:
+        percentages = compute_chunk(resources, rows)["percentages"]
+    return rows[resources.constraints.mask(percentages, specified_constraints)]
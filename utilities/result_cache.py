@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+RESULTS_VERSION = 4 # Part of every key; bumped whenever cached answers may be wrong or of another shape
+RESULTS_FILE = "results.sqlite"
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+def normalize_constraints(specified_constraints: dict) -> dict:
+    """ Canonical form of specified constraints: constraints and variants sorted. The pipeline validates the constraints
+        first (see pipeline.validate_constraints), so {"Allergen": "Eggs"} has become {"Allergen": ["Eggs"]} and is
+        answered, and cached, as the same query. """
+    return {constraint: sorted([variants] if type(variants) == str else variants)
+            for constraint, variants in sorted(specified_constraints.items())}
+
+class ResultCache:
+    def __init__(self, path: str, source: dict, ttl: float = 7 * 24 * 3600, max_entries: int = 10000):
+        """ Content-addressed SQLite cache of refactor results, so that repeated queries skip matching and solving.
+            A result is stored under the hash of everything it depends on: the dataset rows of the dish, the normalized
+            constraints, the substitution flag and the source (dataset, USDA table and configuration hashes).
+            Entries expire after ttl seconds; beyond max_entries, the least recently used ones are evicted.
+            @args:
+                path : str SQLite file of the cache
+                source : dict signature of the data and configuration the results were computed from
+                ttl : float seconds an entry stays valid
+                max_entries : int number of entries kept
+        """
+        self.path = path
+        self.source = source
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._pid = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """ Connection to the cache, opened lazily (and reopened in forked worker processes). """
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=30) # Worker processes share the file
+            self._pid = os.getpid()
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self._db.commit()
+        return self._db
+
+    def key(self, rows: list[int], specified_constraints: dict, substitute: bool = False) -> str:
+        content = {"version": RESULTS_VERSION, "rows": [int(row) for row in rows], "constraints": normalize_constraints(specified_constraints),
+                   "substitute": bool(substitute), "source": self.source}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> dict:
+        """ Cached result under key; None (a miss) if there is none or it expired. """
+        now = time.time()
+        row = self.db.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < now:
+            if row is not None:
+                self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.db.commit()
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, result: dict) -> None:
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, json.dumps(result), now + self.ttl, now))
+        self.evict(now)
+        self.db.commit()
+
+    def evict(self, now: float = None) -> None:
+        """ Drop expired entries, then the least recently used ones beyond max_entries. """
+        self.db.execute("DELETE FROM results WHERE expires < ?", (now or time.time(),))
+        self.db.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self) -> None:
+        self.db.execute("DELETE FROM results")
+        self.db.commit()
+
+    def close(self) -> None:
+        if self._db is not None and self._pid == os.getpid(): self._db.close()
+        self._db = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "size": self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]}
@@ -0,0 +1,155 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from utilities.pipeline import Resources, compile_recipe_book, validate_constraints
+from utilities.batch import answer # Same answers as the batch mode
+from utilities.parallel import RecipePool # Worker processes for the CPU-bound work
+
+MAX_BODY = 1 << 20 # Bytes of a request body
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+          500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# Work done in the executor; module level so that worker processes can run it (see RecipePool.submit)
+def search(resources: Resources, query: dict) -> list[dict]:
+    """ Titles closest to query["q"], with the dataset rows of each. """
+    return [{"title": title, "score": score, "rows": resources.title_index.lookup(title)}
+            for title, score, _ in resources.title_index.search(query["q"], limit=query["limit"])]
+
+def nutrition(resources: Resources, row: int) -> dict:
+    """ The recipe of a dataset row with its compiled nutrition. """
+    recipe = resources.ingredient_store.recipe(row, resources.recipe_data.title(row))
+    compile_recipe_book(resources, [recipe])
+    return {"id": row, **recipe.to_dict()}
+
+class RecipeService:
+    def __init__(self, resources: Resources, workers: int = 1, max_pending: int = 64, timeout: float = 30.0):
+        """ Local HTTP/JSON front end of the pipeline, on asyncio streams (stdlib only):
+                GET  /recipes/search?q=<title>&limit=<n>   closest titles and their dataset rows
+                GET  /recipes/<id>/nutrition                 recipe of a dataset row with its nutrition
+                POST /refactor                               a query as in batch mode, answered as in batch mode
+            Datasets and indexes stay loaded; matching and solving run in an executor, never on the event loop.
+            Identical requests in flight share one computation, at most max_pending computations are queued
+            (503 beyond that), and a request gets timeout seconds before it is answered with 504.
+            @args:
+                resources : Resources of the session
+                workers : int number of worker processes; with 1, a single thread does the work
+                max_pending : int number of distinct computations queued or running at once
+                timeout : float seconds per request
+        """
+        self.resources = resources
+        self.pool = RecipePool(resources, workers) if workers > 1 else None
+        # Forked before the server listens, so workers hold neither the listening socket nor client connections
+        if self.pool is not None: self.pool.start()
+        # The Resources (clingo Controls, SQLite caches) are not thread safe: without a pool, they are only used from one
+        # executor thread. SQLite connections belong to the thread that opens them, so those this thread opened are
+        # closed here (they reopen lazily on the executor thread), and are closed on the executor thread in close()
+        self.executor = self.pool.executor if self.pool is not None else ThreadPoolExecutor(max_workers=1)
+        if self.pool is None: resources.close()
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.in_flight : dict[str, asyncio.Future] = {}
+
+    def close(self) -> None:
+        if self.pool is not None: self.pool.close()
+        else:
+            self.executor.submit(self.resources.close).result()
+            self.executor.shutdown()
+
+    async def run(self, function, argument) -> object:
+        """ function(resources, argument) in the executor, shared with identical requests already in flight. """
+        key = json.dumps([function.__name__, argument], sort_keys=True)
+        future = self.in_flight.get(key)
+        if future is None:
+            if len(self.in_flight) >= self.max_pending: raise HTTPError(503, "Too many requests in progress, retry later")
+            loop = asyncio.get_running_loop()
+            if self.pool is not None: future = asyncio.wrap_future(self.pool.submit(function, argument))
+            else: future = loop.run_in_executor(self.executor, function, self.resources, argument)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        try:
+            # Shielded: a request timing out does not cancel the computation other requests wait for
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(504, f"No answer within {self.timeout} seconds")
+
+    async def route(self, method: str, target: str, body: bytes) -> object:
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["recipes", "search"]:
+            if method != "GET": raise HTTPError(405, "Use GET")
+            params = parse_qs(url.query)
+            if not params.get("q"): raise HTTPError(400, "Missing q")
+            try:
+                limit = int(params.get("limit", ["10"])[0])
+            except ValueError:
+                raise HTTPError(400, "limit must be an integer")
+            return await self.run(search, {"q": params["q"][0], "limit": max(1, min(limit, 100))})
+        if len(parts) == 3 and parts[0] == "recipes" and parts[2] == "nutrition":
+            if method != "GET": raise HTTPError(405, "Use GET")
+            if not parts[1].isdigit() or int(parts[1]) >= len(self.resources.recipe_data): raise HTTPError(404, f"No recipe {parts[1]}")
+            return await self.run(nutrition, int(parts[1]))
+        if parts == ["refactor"]:
+            if method != "POST": raise HTTPError(405, "Use POST")
+            try:
+                query = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise HTTPError(400, f"Invalid JSON: {e}")
+            if type(query) != dict or "dish" not in query: raise HTTPError(400, "Expected {\"dish\": ..., \"specified_constraints\": {...}}")
+            try:
+                validate_constraints(self.resources, query.get("specified_constraints", {}))
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+            return await self.run(answer, query)
+        raise HTTPError(404, f"No route {url.path}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """ One request per connection (Connection: close). """
+        status, result = 200, None
+        try:
+            try:
+                method, target, _ = (await reader.readline()).decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line: break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                raise HTTPError(400, "Malformed request")
+            if length > MAX_BODY: raise HTTPError(413, f"Body over {MAX_BODY} bytes")
+            body = await reader.readexactly(length) if length else b""
+            result = await self.route(method.upper(), target, body)
+        except HTTPError as e:
+            status, result = e.status, {"error": str(e)}
+        except Exception as e:
+            status, result = 500, {"error": f"{type(e).__name__}: {e}"}
+        payload = json.dumps(result).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {STATUS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def serve(resources: Resources, host: str = "127.0.0.1", port: int = 8000, workers: int = 1) -> None:
+    """ Run a RecipeService until interrupted. """
+    service = RecipeService(resources, workers=workers)
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
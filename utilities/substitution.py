@@ -0,0 +1,216 @@
+import copy
+import clingo
+import numpy as np
+from models.classes import Recipe
+from utilities.nutrition import compile_nutrition, line_grams
+from utilities.nutrition_engine import NutritionEngine, PERCENTAGE_RULES
+from utilities.nutrient_index import NutrientIndex
+from utilities.nutrient_neighbors import NutrientNeighbors
+from utilities.allergen_index import AllergenMatcher
+from utilities.constraint_compiler import ConstraintCompiler, PERCENTAGE_COLUMNS
+
+# Options of every offending ingredient: keep it (not for allergens), leave it out, or one of its candidates
+KEEP, OMIT = 0, 1
+
+# Choose one option per offending ingredient; fewest substitutions first, then the smallest nutrient deviation.
+# The bounds of the specified conditions are added as integrity constraints over total/2.
+program = """
+1 { choose(I, O) : option(I, O) } 1 :- slot(I).
+total(M, B + S) :- base(M, B), S = #sum { D, I : choose(I, O), delta(I, O, M, D) }.
+#minimize { 1@2, I : choose(I, O), O != 0 }.
+#minimize { C@1, I, O : choose(I, O), cost(I, O, C) }.
+#show choose/2.
+"""
+
+class Slot:
+    def __init__(self, name: str, description: str, row: int, grams: int, allergen: bool):
+        """ An offending ingredient of a recipe and its replacement options.
+            @args:
+                name : str ingredient as written in the recipe
+                description : str USDA description it matched (None if it matched nothing)
+                row : int USDA row it matched (None if it matched nothing)
+                grams : int weight of the ingredient in the recipe (0 if unknown)
+                allergen : bool, whether it contains a specified allergen, and so cannot be kept
+        """
+        self.name = name
+        self.description = description
+        self.row = row
+        self.grams = grams
+        self.allergen = allergen
+        self.candidates : list[int] = [] # USDA rows of options OMIT+1, OMIT+2, ...
+
+class Substituter:
+    def __init__(self, index: NutrientIndex, matcher, compiler: ConstraintCompiler, allergens: AllergenMatcher,
+                 engine: NutritionEngine = None, neighbors: NutrientNeighbors = None, timeout: float = 2.0,
+                 max_candidates: int = 8, max_slots: int = 4, daily_calories: int = 2000):
+        """ Refactors a recipe that violates its constraints by replacing its offending ingredients with USDA foods.
+            The choice is an optimization problem solved by clingo (#minimize): every condition bound must hold on
+            the new totals, with as few substitutions as possible and, among those, the closest nutrients.
+            @args:
+                index : NutrientIndex the candidates are drawn from
+                matcher : NutrientIndex or MatchCache used by the nutrition pass
+                compiler : ConstraintCompiler with the bounds of the conditions
+                allergens : AllergenMatcher tagging ingredients and candidates
+                engine : NutritionEngine for the nutrition pass (default is clingo)
+                neighbors : NutrientNeighbors of index ranking the candidates (default is built from index)
+                timeout : float seconds the optimization may run; the best substitution found by then is used
+                max_candidates : int number of candidates per offending ingredient
+                max_slots : int number of ingredients substituted for the nutrient conditions
+                daily_calories : int daily caloric intake the percentages refer to
+        """
+        self.index = index
+        self.matcher = matcher
+        self.compiler = compiler
+        self.allergens = allergens
+        self.engine = engine
+        self.timeout = timeout
+        self.max_candidates = max_candidates
+        self.max_slots = max_slots
+        self.daily_calories = daily_calories
+        self.neighbors = neighbors or NutrientNeighbors(index)
+        self.scale = self.neighbors.scale # Per nutrient, for deviations
+        self._description_masks = None
+
+    @property
+    def description_masks(self) -> np.ndarray:
+        """ Allergen mask of every USDA description, computed on first use. """
+        if self._description_masks is None:
+            self._description_masks = np.fromiter((self.allergens.mask(d) for d in self.index.descriptions), dtype=np.uint32, count=len(self.index))
+        return self._description_masks
+
+    def slots(self, recipe: Recipe, specified_constraints: dict) -> list[Slot]:
+        """ Offending ingredients: those containing a specified allergen, then the largest contributors to every
+            percentage above its max bound. Percentages below a min bound pick no ingredient to replace: the solve
+            still enforces min bounds, so such a recipe is only refactored if the other substitutions happen to fix it. """
+        wanted = self.allergens.bits(specified_constraints.get('Allergen', []))
+        slots : dict[str, Slot] = {}
+        def slot(ingredient_info, match, allergen):
+            key = match[0] if match else ingredient_info[0]
+            if key not in slots:
+                slots[key] = Slot(ingredient_info[0], match and match[0], match and match[2], recipe.grams.get(key, 0), allergen)
+            slots[key].allergen |= allergen
+        for ingredient_info, match in zip(recipe.list, recipe.matches):
+            if self.allergens.mask(ingredient_info[0]) & wanted: slot(ingredient_info, match, True)
+
+        numeric = 0
+        for condition in self.compiler.conditions_of(specified_constraints):
+            for metric, bound in condition.bounds.items():
+                if recipe.percentages.get(metric, 0) <= bound.get("max", recipe.percentages.get(metric, 0)): continue
+                column = PERCENTAGE_RULES[PERCENTAGE_COLUMNS[metric]][1]
+                contributors = sorted(((values[column], description) for description, values in recipe.ingredient_nutrition.items() if values[column] > 0), reverse=True)
+                for _, description in contributors:
+                    if numeric >= self.max_slots: break
+                    if description in slots: continue
+                    ingredient_info, match = next((info, match) for info, match in zip(recipe.list, recipe.matches) if match and match[0] == description)
+                    slot(ingredient_info, match, False)
+                    numeric += 1
+        return list(slots.values())
+
+    def candidates(self, slot: Slot, wanted: int, columns: list[int]) -> list[int]:
+        """ USDA rows that could replace an ingredient: free of the specified allergens, lower in every offending
+            nutrient, and preferably sharing a description token with the original; nearest in nutrition first. """
+        if slot.row is None: return []
+        mask = (self.description_masks & np.uint32(wanted)) == 0
+        related = self.index.candidates(self.index.descriptions[slot.row].split(","))
+        if len(related) >= self.max_candidates: # Otherwise every description is a candidate
+            mask &= np.isin(np.arange(len(self.index)), related)
+        rows, _ = self.neighbors.query(slot.row, self.max_candidates, lower=columns, mask=mask)
+        return [int(row) for row in rows]
+
+    def contribution(self, row: int, grams: int) -> list[int]:
+        """ Scaled nutrient values of grams of a USDA row, as total_ingredient computes them; row None adds nothing. """
+        if row is None: return [0] * len(self.scale)
+        return [value * grams // 100000 for value in self.matcher.nutrition_values(row)]
+
+    def cost(self, slot: Slot, row: int) -> int:
+        """ Nutrient deviation of an option from the original ingredient; row None leaves the ingredient out. """
+        if slot.row is None: return 0
+        replacement = self.index.values[row] if row is not None else np.zeros(len(self.scale))
+        return int(round((np.abs(replacement - self.index.values[slot.row]) / self.scale).sum() * max(slot.grams, 1)))
+
+    def solve(self, recipe: Recipe, specified_constraints: dict, slots: list[Slot]) -> dict[int, int]:
+        """ The chosen option of every slot, or None if no combination satisfies the bounds (within the timeout). """
+        conditions = self.compiler.conditions_of(specified_constraints)
+        columns = sorted({PERCENTAGE_RULES[PERCENTAGE_COLUMNS[metric]][1] for condition in conditions for metric in condition.bounds})
+        factors = {column: factor for _, column, factor in PERCENTAGE_RULES}
+        number = clingo.Number
+        facts = []
+        # Totals of the ingredients that stay as they are; every slot adds the contribution of its chosen option
+        kept = [values for description, values in recipe.ingredient_nutrition.items() if description not in {slot.description for slot in slots}]
+        for column in columns: facts.append(clingo.Function("base", [number(column), number(sum(values[column] for values in kept))]))
+        for i, slot in enumerate(slots):
+            facts.append(clingo.Function("slot", [number(i)]))
+            options = {OMIT: None, **{OMIT + 1 + k: row for k, row in enumerate(slot.candidates)}}
+            if not slot.allergen: options[KEEP] = slot.row
+            for option, row in options.items():
+                facts.append(clingo.Function("option", [number(i), number(option)]))
+                if option == KEEP: contribution = recipe.ingredient_nutrition.get(slot.description, [0] * len(self.scale))
+                else: contribution = self.contribution(row, slot.grams)
+                for column in columns: facts.append(clingo.Function("delta", [number(i), number(option), number(column), number(contribution[column])]))
+                facts.append(clingo.Function("cost", [number(i), number(option), number(0 if option == KEEP else self.cost(slot, row))]))
+
+        bounds = []
+        for condition in conditions:
+            for metric, bound in condition.bounds.items():
+                column = PERCENTAGE_RULES[PERCENTAGE_COLUMNS[metric]][1]
+                if "max" in bound: bounds.append(f":- total({column}, G), G * {factors[column]} / {self.daily_calories} > {int(bound['max'])}.")
+                if "min" in bound: bounds.append(f":- total({column}, G), G * {factors[column]} / {self.daily_calories} < {int(bound['min'])}.")
+
+        ctl = clingo.Control(["--opt-mode=opt", "--warn=none"])
+        ctl.add("base", [], program + "\n".join(bounds))
+        with ctl.backend() as backend:
+            for symbol in facts: backend.add_rule([backend.add_atom(symbol)])
+        ctl.ground([("base", [])])
+        best = []
+        def on_model(model): best[:] = model.symbols(shown=True) # Every model improves on the previous one
+        with ctl.solve(on_model=on_model, async_=True) as handle:
+            if not handle.wait(self.timeout): handle.cancel()
+            handle.get()
+        if not len(best): return None
+        return {symbol.arguments[0].number: symbol.arguments[1].number for symbol in best}
+
+    def refactor(self, recipe: Recipe, specified_constraints: dict) -> Recipe:
+        """ A copy of the recipe with its offending ingredients substituted so that it meets the specified constraints.
+            @args:
+                recipe : Recipe violating the constraints
+                specified_constraints : dict of constraint -> variant(s), shaped like config/constraints.json
+            @return:
+                Recipe - The refactored recipe (see Recipe.substitutions), with its nutrition compiled, or None if
+                         no substitution within the candidates satisfies the constraints.
+        """
+        original = copy.deepcopy(recipe)
+        original.row = None # No longer a dataset recipe once changed; the per-ingredient breakdown is needed too
+        original.reset_nutrition()
+        compile_nutrition(original, self.matcher, engine=self.engine)
+        slots = self.slots(original, specified_constraints)
+        if not len(slots): return None
+        wanted = self.allergens.bits(specified_constraints.get('Allergen', []))
+        offending = [PERCENTAGE_RULES[PERCENTAGE_COLUMNS[metric]][1] for condition in self.compiler.conditions_of(specified_constraints)
+                     for metric, bound in condition.bounds.items() if original.percentages.get(metric, 0) > bound.get("max", float("inf"))]
+        for slot in slots: slot.candidates = self.candidates(slot, wanted, offending)
+        choice = self.solve(original, specified_constraints, slots)
+        if choice is None: return None
+
+        refactored = copy.deepcopy(original)
+        refactored.list, refactored.matches, refactored.allergens = [], [], None
+        replacements = {}
+        for i, slot in enumerate(slots):
+            option = choice[i]
+            if option == KEEP: continue
+            row = None if option == OMIT else slot.candidates[option - OMIT - 1]
+            replacements[slot.description or slot.name] = row
+            refactored.substitutions.append((slot.name, "(omitted)" if row is None else self.index.descriptions[row]))
+        for ingredient_info, match in zip(original.list, original.matches):
+            key = match[0] if match else ingredient_info[0]
+            if key not in replacements:
+                refactored.list.append(ingredient_info)
+                refactored.matches.append(match)
+            elif replacements[key] is not None:
+                row = replacements[key]
+                grams = line_grams(ingredient_info, match) if match else None
+                if grams is not None: refactored.list.append([self.index.descriptions[row], grams, 'g']) # Same weight as this line
+                else: refactored.list.append([self.index.descriptions[row], ingredient_info[1], ingredient_info[2]])
+                refactored.matches.append((self.index.descriptions[row], 100.0, row))
+        refactored.reset_nutrition()
+        compile_nutrition(refactored, self.matcher, engine=self.engine)
+        return refactored
@@ -1,93 +1,81 @@
 from models.classes import Recipe
-from utilities.asp import clingoResolver as cR # Importing the asp module for Answer Set Programming (ASP) logic
-def test_allergens(recipe : Recipe, allergens : list[str]):
+from utilities.constraint_compiler import ConstraintCompiler, default_compiler # Bounds of config/constraints.json, compiled
+from utilities.allergen_index import AllergenMatcher, default_matcher # Compiled allergen taxonomy
+
+def test_allergens(recipe : Recipe, allergens : list[str], matcher : AllergenMatcher = None):
         """ Test for allergens in the recipe. Returns 1 if no allergens are detected, 0 if allergens are detected.
             @args:
                 recipe : Recipe object to be tested
                 allergens : list of allergens to be tested against the recipe
+                matcher : compiled allergen taxonomy (default is config/allergens.json)
             @return:
                 0 if no allergens are detected, 1 if allergens are detected.
         """
         # print("Test A")
+        if matcher is None: matcher = default_matcher()
         ingredients = [x[0] for x in recipe.list]
-        for allergen in allergens:
+        # Recipes from the ingredient store carry the mask computed at ingest time; a single AND decides
+        mask = recipe.allergens if recipe.allergens is not None else matcher.recipe_mask(ingredients)
+        if mask & matcher.bits(allergens): return 1
+        # Allergens outside the taxonomy fall back to a substring test
+        for allergen in [a for a in allergens if not matcher.bits([a])]:
                 for ingredient in ingredients:
                         if allergen.lower() in ingredient.lower(): return 1 # Upon detection of allergen in the recipe, return fail (0)
         return 0
 
-def test_diabetes(recipe : Recipe, type, diabetic : cR):
-        """ Test for diabetes in the recipe. Returns 1 if no diabetes is detected, 0 if diabetes is detected.
+def test_condition(recipe : Recipe, constraint : str, variants, compiler : ConstraintCompiler = None):
+        """ Test the recipe against the compiled bounds of a condition (see config/constraints.json).
             @args:
-                recipe : Recipe object to be tested
-                type : int representing the type of diabetes (1 or 2)
+                recipe : Recipe object to be tested, with its nutrition compiled
+                constraint : str name of the condition
+                variants : variant(s) of the condition, as specified by the user
+                compiler : compiled constraints (default is config/constraints.json)
             @return:
-                0 if no high sugar levels are detected, else 1 if diabetes is detected.
+                0 if the recipe is within every bound, else 1.
         """
-        for nv in recipe.nutritional_values:
-                value = int(recipe.nutritional_values[nv])
-                if nv == "Sugar": diabetic.add_pct_1("sugar", value)
-                elif nv == "SaturatedFat": diabetic.add_pct_1("satfat", value)
-                elif nv == "TotalFat": diabetic.add_pct_1("fat", value)
-                elif nv == "Protein": diabetic.add_pct_1("protein", value)
-                elif nv == "Carbohydrate": diabetic.add_pct_1("carb", value)
-        clingo_predicate = (f""":-total_carb_pct(P), P > 50."""
-                            f""":-total_protein_pct(P), P > 20."""
-                            f""":-total_fat_pct(P), P > 35.""") if int(type[-1]) == 1 else (
-                                f""":-total_carb_pct(P), P > 50."""
-                                f""":-total_protein_pct(P), P > 25."""
-                                f""":-total_fat_pct(P), P > 35.""")
-        diabetic.ctl.add(clingo_predicate)
-        diabetic.ctl.ground()
+        return test_conditions(recipe, {constraint: variants}, compiler)
 
-        results, flag = diabetic.resolve()
-        print("Results: ", results, flag)
+def test_conditions(recipe : Recipe, specified_constraints : dict, compiler : ConstraintCompiler = None):
+        """ Test the recipe against every specified condition at once: one grounding and one solve.
+            @args:
+                recipe : Recipe object to be tested, with its nutrition compiled
+                specified_constraints : dict of constraint -> variant(s), as specified by the user
+                compiler : compiled constraints (default is config/constraints.json)
+            @return:
+                0 if the recipe is within every bound, else 1.
+        """
+        if compiler is None: compiler = default_compiler()
+        flag, _ = compiler.solve(recipe, specified_constraints)
         if not flag: return 1 # On SAT, approve this. On UNSAT, reject this
         return 0
 
-def test_hypertension(recipe: Recipe, hypertension: cR):
+def test_diabetes(recipe : Recipe, type, compiler : ConstraintCompiler = None):
+        """ Test for diabetes in the recipe. Returns 1 if no diabetes is detected, 0 if diabetes is detected.
+            @args:
+                recipe : Recipe object to be tested
+                type : str variant of diabetes ("Type 1" or "Type 2")
+                compiler : compiled constraints (default is config/constraints.json)
+            @return:
+                0 if no high sugar levels are detected, else 1 if diabetes is detected.
+        """
+        return test_condition(recipe, 'Diabetes', type, compiler)
+
+def test_hypertension(recipe: Recipe, compiler : ConstraintCompiler = None):
         """ Test for hypertension in the recipe. Returns 1 if no hypertension is detected, 0 if hypertension is detected.
             @args:
                 recipe : Recipe object to be tested
+                compiler : compiled constraints (default is config/constraints.json)
             @return:
                 0 if no high sugar levels are detected, else 1 if diabetes is detected.
         """
-        for nv in recipe.nutritional_values:
-                value = int(recipe.nutritional_values[nv])
-                if nv == "Sugar": hypertension.add_pct_1("sugar", value)
-                elif nv == "SaturatedFat": hypertension.add_pct_1("satfat", value)
-                elif nv == "TotalFat": hypertension.add_pct_1("fat", value)
-                elif nv == "Protein": hypertension.add_pct_1("protein", value)
-                elif nv == "Carbohydrate": hypertension.add_pct_1("carb", value)
-        clingo_predicate = (f""":-total_satfat_pct(P), P > 6."""
-                            f""":-total_fat_pct(P), P > 27."""
-                            f""":-total_protein_pct(P), P > 10."""
-                            f""":-total_carb_pct(P), P > 55.""")
-        hypertension.ctl.add(clingo_predicate)
-        hypertension.ctl.ground()
-        results, flag = hypertension.resolve()
-        print("Results: ", results, flag)
-        if not flag: return 1 # On SAT, approve this. On UNSAT, reject this
-        return 0
+        return test_condition(recipe, 'Hypertension', [], compiler)
 
-def test_obesity(recipe: Recipe, obesity: cR):
+def test_obesity(recipe: Recipe, compiler : ConstraintCompiler = None):
         """ Test for obesity in the recipe. Returns 1 if no obesity is detected, 0 if obesity is detected.
             @args:
                 recipe : Recipe object to be tested
+                compiler : compiled constraints (default is config/constraints.json)
             @return:
                 0 if no high sugar levels are detected, else 1 if diabetes is detected.
         """
-        for nv in recipe.nutritional_values:
-                value = int(recipe.nutritional_values[nv])
-                if nv == "Sugar": obesity.add_pct_1("sugar", value)
-                elif nv == "SaturatedFat": obesity.add_pct_1("satfat", value)
-                elif nv == "TotalFat": obesity.add_pct_1("fat", value)
-                elif nv == "Protein": obesity.add_pct_1("protein", value)
-                elif nv == "Carbohydrate": obesity.add_pct_1("carb", value)
-        clingo_predicate = (f""":-total_fat_pct(P), P > 35."""
-                            f""":-total_carb_pct(P), P > 65.""")
-        obesity.ctl.add(clingo_predicate)
-        obesity.ctl.ground()
-        results, flag = obesity.resolve()
-        print("Results: ", results, flag)
-        if not flag: return 1 # On SAT, approve this. On UNSAT, reject this
-        return 0
+        return test_condition(recipe, 'Obesity', [], compiler)
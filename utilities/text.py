@@ -0,0 +1,12 @@
+import re
+
+def singular(word: str) -> str:
+    """ Crude singular of an English word; only needs to map "eggs" and "egg" to the same key. """
+    if len(word) > 3 and word.endswith("ies"): return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("oes"): return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"): return word[:-1]
+    return word
+
+def words(text: str) -> list[str]:
+    """ Lower case, singular words of an ingredient or taxonomy term; "Half-and-Half" -> ['half', 'and', 'half']. """
+    return [singular(word) for word in re.findall(r"[a-z0-9]+", text.lower().replace("'", ""))]
@@ -0,0 +1,129 @@
+import os
+import re
+import pickle
+import numpy as np
+import rapidfuzz # Utilized for fuzzy string matching recipes and ingredients
+from utilities.dataset_cache import RecipeDataset
+
+INDEX_VERSION = 1
+INDEX_FILE = "title_index.pkl"
+
+def normalize_title(title: str) -> str:
+    """ Case and whitespace insensitive form of a title; "Sugar  Cookies " and "sugar cookies" share one entry. """
+    return re.sub(r'\s+', ' ', title).strip().lower()
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TitleIndex:
+    def __init__(self, titles: list[str], source: dict = None):
+        """ Lookup structure over all recipe titles, built once and saved next to the dataset.
+            - exact: normalized title -> row ids, for exact hits
+            - trigram inverted index: trigram -> ids of the (unique, normalized) titles containing it, used to
+              narrow fuzzy candidates to a small set before rapidfuzz scores them
+            @args:
+                titles : list of titles, position == dataset row
+                source : dict signature of the dataset the titles come from; used to detect a stale index
+        """
+        self.source = source
+        self.exact : dict[str, list[int]] = {}
+        self.display : list[str] = [] # Title (as first seen) shown to the user for each unique normalized title
+        for row, title in enumerate(titles):
+            key = normalize_title(title)
+            rows = self.exact.get(key)
+            if rows is None:
+                self.exact[key] = rows = []
+                self.display.append(title)
+            rows.append(row)
+        self.keys : list[str] = list(self.exact)
+
+        # Trigram postings stored as CSR: postings[offsets[k]:offsets[k+1]] are the title ids of self.grams[k]
+        postings : dict[str, list[int]] = {}
+        for i, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(i)
+        self.grams = sorted(postings)
+        lengths = [len(postings[gram]) for gram in self.grams]
+        self.offsets = np.zeros(len(self.grams) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.postings = np.fromiter((i for gram in self.grams for i in postings[gram]), dtype=np.int32, count=int(self.offsets[-1]))
+        self._gram_ids = {gram: k for k, gram in enumerate(self.grams)}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_gram_ids'] # Cheap to rebuild, so keep it out of the file
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._gram_ids = {gram: k for k, gram in enumerate(self.grams)}
+
+    @classmethod
+    def open(cls, dataset: RecipeDataset) -> 'TitleIndex':
+        """ Load the index saved next to dataset, building and saving it first if it is missing or stale. """
+        path = os.path.join(dataset.cache_dir, INDEX_FILE)
+        source = {"version": INDEX_VERSION, **dataset.meta["source"]}
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                index = pickle.load(file)
+            if index.source == source: return index
+        print(f"Building title index in {dataset.cache_dir}...")
+        index = cls(dataset.titles(), source)
+        with open(path, 'wb') as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return index
+
+    def lookup(self, title: str) -> list[int]:
+        """ Rows whose title matches exactly (up to case and whitespace); empty if there are none. """
+        return list(self.exact.get(normalize_title(title), []))
+
+    def candidates(self, query: str, limit: int) -> np.ndarray:
+        """ Ids of the (at most limit) titles sharing the most trigrams with query. """
+        ids = [self._gram_ids[gram] for gram in trigrams(query) if gram in self._gram_ids]
+        if not len(ids): return np.arange(min(limit, len(self.keys)))
+        counts = np.bincount(np.concatenate([self.postings[self.offsets[k]:self.offsets[k + 1]] for k in ids]), minlength=len(self.keys))
+        hits = np.flatnonzero(counts)
+        if len(hits) > limit: hits = hits[np.argpartition(counts[hits], -limit)[-limit:]]
+        return np.sort(hits) # Keep dataset order among equal scores, as a full scan would
+
+    def matching(self, pattern: str, regex: bool = False) -> np.ndarray:
+        """ Rows of every title containing pattern (up to case and whitespace), or matching it as a regular expression.
+            Substring patterns are only checked against the titles holding all of their trigrams.
+            @return:
+                array of the matching rows, in dataset order
+        """
+        if regex:
+            compiled = re.compile(pattern, re.IGNORECASE)
+            ids = [i for i, key in enumerate(self.keys) if compiled.search(key)]
+        else:
+            query = normalize_title(pattern)
+            grams = trigrams(query)
+            if len(grams):
+                if any(gram not in self._gram_ids for gram in grams): return np.zeros(0, dtype=np.int64)
+                postings = sorted((self.postings[self.offsets[k]:self.offsets[k + 1]] for k in map(self._gram_ids.get, grams)), key=len)
+                candidates = postings[0]
+                for posting in postings[1:]: candidates = np.intersect1d(candidates, posting, assume_unique=True)
+            else:
+                candidates = range(len(self.keys))
+            ids = [i for i in candidates if query in self.keys[i]]
+        if not len(ids): return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([np.asarray(self.exact[self.keys[i]], dtype=np.int64) for i in ids]))
+
+    def search(self, query: str, limit: int = 100, scorer=rapidfuzz.fuzz.partial_ratio, candidates: int = 2000) -> list[tuple[str, float, int]]:
+        """ Fuzzy title search. Only the candidates sharing the most trigrams with the query are scored.
+            @args:
+                query : str title as typed by the user
+                limit : int maximum number of matches returned
+                scorer : rapidfuzz scorer used to rank the candidates
+                candidates : int number of trigram candidates handed to rapidfuzz
+            @return:
+                list of (title, score, row) tuples, best first, like rapidfuzz.process.extract over all titles
+        """
+        query = normalize_title(query)
+        if len(query) < 3: # Too short to have trigrams; score everything
+            ids = np.arange(len(self.keys))
+        else:
+            ids = self.candidates(query, candidates)
+        choices = [self.keys[i] for i in ids]
+        matches = rapidfuzz.process.extract(query, choices, scorer=scorer, limit=limit)
+        return [(self.display[ids[m[2]]], m[1], self.exact[m[0]][0]) for m in matches]
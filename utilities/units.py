@@ -0,0 +1,96 @@
+import os
+import json
+from utilities.text import words # Same singular, lower case words as the allergen taxonomy
+
+units_filepath = os.path.join(os.path.dirname(__file__), "..", "config", "units.json")
+
+class UnitRegistry:
+    def __init__(self, unit_data: dict):
+        """ Units of config/units.json compiled into lookups, shared by the ASP program (see program) and the
+            NutritionEngine so that both convert identically:
+            - aliases: every spelling the ingredient parser captures ("oz.", "C.", "pkg") -> canonical unit
+            - factors: canonical mass unit -> milligrams, canonical volume unit -> microliters (ml * 1000)
+            - pieces: weight in grams of one piece ("stick" of butter, a large "egg") per ingredient keyword;
+              "*" is the weight of a piece of anything else
+            @args:
+                unit_data : dict of config/units.json
+            @raise:
+                ValueError - On an alias given to two units, or a unit of unknown kind.
+        """
+        self.aliases : dict[str, str] = {}
+        self.factors : dict[str, tuple[str, int]] = {}
+        self.pieces : dict[str, dict[tuple, int]] = {}
+        def alias(spelling, unit):
+            spelling = " ".join(spelling.lower().split())
+            if self.aliases.get(spelling, unit) != unit: raise ValueError(f"Unit alias of both {self.aliases[spelling]} and {unit}: {spelling!r}")
+            self.aliases[spelling] = unit
+        for unit, info in unit_data["units"].items():
+            if info["kind"] not in ("mass", "volume"): raise ValueError(f"Unknown kind of unit {unit}: {info['kind']}")
+            self.factors[unit] = (info["kind"], int(info["factor"]))
+            for spelling in [unit] + info["aliases"]: alias(spelling, unit)
+        for unit, info in unit_data["pieces"].items():
+            self.pieces[unit] = {tuple(words(keyword)) if keyword != "*" else "*": grams for keyword, grams in info["weights"].items()}
+            for spelling in [unit] + info["aliases"]: alias(spelling, unit)
+        # Units of factor 1000 (gram, milliliter): fractional quantities are expressed in them instead of truncated
+        self.base : dict[str, str] = {kind: unit for unit, (kind, factor) in self.factors.items() if factor == 1000}
+        self.longest = max((len(keyword) for weights in self.pieces.values() for keyword in weights if keyword != "*"), default=0)
+
+    @classmethod
+    def open(cls, path: str = units_filepath) -> 'UnitRegistry':
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file))
+
+    @property
+    def program(self) -> str:
+        """ unit(Unit, Kind, Factor) facts of the ASP program. """
+        return "\n".join(f"unit({unit}, {kind}, {factor})." for unit, (kind, factor) in self.factors.items())
+
+    def canonical(self, metric: str) -> str:
+        """ Canonical unit of a captured metric; no metric ('') counts pieces. None if the unit is unknown. """
+        return self.aliases.get(" ".join((metric or "").lower().split()))
+
+    def piece_weight(self, unit: str, ingredient: str) -> int:
+        """ Grams of one piece of an ingredient, from its longest keyword ("egg yolks" -> "egg yolk"); None if unknown. """
+        weights = self.pieces[unit]
+        tokens = words(ingredient)
+        for n in range(min(self.longest, len(tokens)), 0, -1):
+            for i in range(len(tokens) - n + 1):
+                if tuple(tokens[i:i + n]) in weights: return weights[tuple(tokens[i:i + n])]
+        return weights.get("*")
+
+    def resolve(self, ingredient: str, quantity: float, metric: str) -> tuple[int, str]:
+        """ (quantity, unit) of an ingredient line as the nutrition engines take it, in integers: whole masses and
+            volumes keep their canonical unit, fractions ("1/2 c.") go to grams or milliliters, pieces are weighed into grams.
+            @args:
+                ingredient : str name of the ingredient as written in the recipe, for piece weights
+                quantity : float parsed quantity, or None
+                metric : str unit as captured by the ingredient parser
+            @return:
+                tuple - (int quantity, canonical unit), or (None, None) if the line cannot be weighed
+        """
+        unit = self.canonical(metric)
+        if quantity is None or unit is None: return None, None
+        if unit in self.factors:
+            if quantity == int(quantity): return int(quantity), unit
+            kind, factor = self.factors[unit]
+            return int(quantity * factor / 1000), self.base[kind]
+        grams = self.piece_weight(unit, ingredient)
+        if grams is None: return None, None
+        return int(quantity * grams), "gram"
+
+    def grams(self, quantity: int, unit: str, density: int = None) -> int:
+        """ convert/6 of the ASP program: grams of a quantity; volumes need the ingredient's density (g/ml * 1000).
+            None where the program derives nothing. """
+        if quantity is None: return None
+        kind, factor = self.factors.get(unit or "gram", (None, None))
+        if kind == "mass": return quantity * factor // 1000
+        if kind == "volume" and density is not None: return quantity * factor * density // (1000 * 1000)
+        return None
+
+_default_registry : UnitRegistry = None
+
+def default_registry() -> UnitRegistry:
+    """ Registry of config/units.json shared by everything in this process that does not bring its own. """
+    global _default_registry
+    if _default_registry is None: _default_registry = UnitRegistry.open()
+    return _default_registry
@@ -0,0 +1,179 @@
+import os
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from models.classes import Recipe
+try:
+    import pyarrow as pa # Optional: only the Parquet writer needs it
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+NUTRIENT_COLUMNS = ['Calories', 'Protein', 'TotalFat', 'Carbohydrate', 'Sodium', 'SaturatedFat', 'Cholesterol', 'Sugar',
+                    'Calcium', 'Iron', 'Potassium', 'VitaminC', 'VitaminE', 'VitaminD'] # Recipe.nutritional_values keys
+PERCENTAGE_COLUMNS = ['carb', 'protein', 'fat', 'satfat', 'sugar'] # Recipe.percentages keys
+
+def flatten(result: dict) -> dict:
+    """ One flat row of a result (see batch.answer): scalars, one column per nutrient and percentage, and the lists
+        (ingredients, per-ingredient nutrition, substitutions, violations) as JSON text. """
+    recipe = result.get("recipe") or {}
+    row = {"id": result.get("id"), "query": result.get("query"), "status": result.get("status"), "dish": result.get("dish"),
+           "variants": result.get("variants"), "specified_constraints": json.dumps(result.get("specified_constraints", {})),
+           "error": result.get("error")}
+    for metric in NUTRIENT_COLUMNS: row[metric] = recipe.get("nutritional_values", {}).get(metric)
+    for metric in PERCENTAGE_COLUMNS: row[f"{metric}_pct"] = recipe.get("percentages", {}).get(metric)
+    for field in ("ingredients", "ingredient_nutrition", "substitutions"): row[field] = json.dumps(recipe.get(field, []))
+    row["violations"] = json.dumps(result.get("violations", []))
+    return row
+
+class ResultWriter(ABC):
+    extensions : tuple[str] = ()
+
+    def __init__(self, path: str, append: bool = False, buffer_size: int = 256):
+        """ Output of results (see batch.answer): they are buffered and written buffer_size at a time.
+            Subclasses implement write_rows; use as a context manager, or call close, so the last buffer is written.
+            @args:
+                path : str file to write to
+                append : bool, whether to add to an existing file instead of replacing it
+                buffer_size : int number of results held before they are written
+        """
+        self.path = path
+        self.append = append
+        self.buffer_size = buffer_size
+        self.buffer : list[dict] = []
+        self.written = 0
+
+    def __enter__(self) -> 'ResultWriter':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def write(self, result: dict) -> None:
+        self.buffer.append(result)
+        if len(self.buffer) >= self.buffer_size: self.flush()
+
+    def flush(self) -> None:
+        if len(self.buffer): self.write_rows(self.buffer)
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    @abstractmethod
+    def write_rows(self, results: list[dict]) -> None:
+        """ Write one buffer of results. """
+
+    def close(self) -> None:
+        self.flush()
+
+class JSONLWriter(ResultWriter):
+    extensions = (".jsonl", ".json")
+
+    def __init__(self, path: str, append: bool = False, buffer_size: int = 256):
+        """ One JSON object per result and line. """
+        super().__init__(path, append, buffer_size)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write_rows(self, results: list[dict]) -> None:
+        self.file.write("".join(json.dumps(result) + "\n" for result in results))
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+class TextWriter(ResultWriter):
+    extensions = (".txt",)
+
+    def __init__(self, path: str, append: bool = False, buffer_size: int = 256):
+        """ Readable text (see Recipe.render), every result one after the other in a single file. """
+        super().__init__(path, append, buffer_size)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    @staticmethod
+    def render(result: dict) -> str:
+        """ Text of a result; only the recipe for results without a status (a recipe of the interactive mode). """
+        lines = []
+        if "status" in result:
+            lines.append(f"Query: {result.get('query')} {json.dumps(result.get('specified_constraints', {}))} -> {result['status']}")
+            if result.get("error"): lines.append(f"Error: {result['error']}")
+            if len(result.get("violations", [])): lines.append(f"Violations: {', '.join(result['violations'])}")
+            lines.append("")
+        text = "\n".join(lines) + ("\n" if len(lines) else "")
+        return text + (Recipe.render(result["recipe"]) if result.get("recipe") else "")
+
+    def write_rows(self, results: list[dict]) -> None:
+        self.file.write("".join(self.render(result) for result in results))
+
+    def close(self) -> None:
+        super().close()
+        self.file.close()
+
+class SQLiteWriter(ResultWriter):
+    extensions = (".sqlite", ".db")
+
+    def __init__(self, path: str, append: bool = False, buffer_size: int = 256):
+        """ Table results (one flat row per result, see flatten), and table ingredient_nutrition (one row per matched
+            ingredient of each result recipe, referencing results.rowid). Each buffer is written in one transaction. """
+        super().__init__(path, append, buffer_size)
+        if not append and os.path.isfile(path): os.remove(path)
+        self.db = sqlite3.connect(path)
+        columns = ", ".join(flatten({}))
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS results ({columns})")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS ingredient_nutrition (result INTEGER, ingredient TEXT, grams INTEGER, {', '.join(NUTRIENT_COLUMNS)})")
+        self.db.commit()
+
+    def write_rows(self, results: list[dict]) -> None:
+        with self.db:
+            for result in results:
+                row = flatten(result)
+                cursor = self.db.execute(f"INSERT INTO results VALUES ({', '.join('?' * len(row))})", list(row.values()))
+                breakdown = (result.get("recipe") or {}).get("ingredient_nutrition", [])
+                self.db.executemany(f"INSERT INTO ingredient_nutrition VALUES ({', '.join('?' * (len(NUTRIENT_COLUMNS) + 3))})",
+                                    [[cursor.lastrowid, item["ingredient"], item["grams"]] + [item.get(metric) for metric in NUTRIENT_COLUMNS]
+                                     for item in breakdown])
+
+    def close(self) -> None:
+        super().close()
+        self.db.close()
+
+class ParquetWriter(ResultWriter):
+    extensions = (".parquet",)
+
+    def __init__(self, path: str, append: bool = False, buffer_size: int = 256):
+        """ One flat row per result (see flatten); each buffer is a row group. Requires pyarrow; Parquet files cannot be
+            appended to, so append is not supported.
+            @raise:
+                ImportError - If pyarrow is not installed.
+                ValueError - On append.
+        """
+        if pa is None: raise ImportError("Writing Parquet requires pyarrow")
+        if append: raise ValueError("Parquet files cannot be appended to")
+        super().__init__(path, append, buffer_size)
+        fields = [(column, pa.string()) for column in flatten({})]
+        types = {"variants": pa.int64(), **{metric: pa.float64() for metric in NUTRIENT_COLUMNS},
+                 **{f"{metric}_pct": pa.int64() for metric in PERCENTAGE_COLUMNS}}
+        self.schema = pa.schema([(column, types.get(column, kind)) for column, kind in fields])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write_rows(self, results: list[dict]) -> None:
+        rows = [flatten(result) for result in results]
+        for row in rows:
+            if row["id"] is not None: row["id"] = str(row["id"]) # Ids of queries are numbers or strings
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self) -> None:
+        super().close()
+        self.writer.close()
+
+# Output formats by name; other writers can be registered here
+WRITERS : dict[str, type] = {"jsonl": JSONLWriter, "text": TextWriter, "sqlite": SQLiteWriter, "parquet": ParquetWriter}
+
+def open_writer(path: str, format: str = None, append: bool = False, buffer_size: int = 256) -> ResultWriter:
+    """ Writer of a format, by default the one whose extension the path has (JSONL for unknown extensions).
+        @raise:
+            ValueError - On an unknown format.
+    """
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        format = next((name for name, writer in WRITERS.items() if extension in writer.extensions), "jsonl")
+    if format not in WRITERS: raise ValueError(f"Unknown output format: {format}")
+    return WRITERS[format](path, append=append, buffer_size=buffer_size)